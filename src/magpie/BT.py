@@ -15,7 +15,7 @@ import py_trees.console as console
 
 from magpie.poses import pose_error, rotate_pose
 
-_GRIP_WAIT_S = 1.5
+_GRIP_WAIT_S = 1.5 # longest wait for the fingers to settle
 _DUMMYPOSE   = np.eye(4)
 
 
@@ -182,7 +182,7 @@ class Open_Gripper( BasicBehavior ):
         """ Actually Move """
         super().initialise()
         self.ctrl.open_gripper()
-        sleep( self.wait_s )
+        self.ctrl.wait_gripper( self.wait_s )
         
         
     def update( self ):
@@ -208,7 +208,7 @@ class Set_Gripper( BasicBehavior ):
         """ Actually Move """
         super().initialise()
         self.ctrl.set_gripper( self.width_m )
-        sleep( self.wait_s )
+        self.ctrl.wait_gripper( self.wait_s )
         
     
     def update( self ):
@@ -233,7 +233,7 @@ class Close_Gripper( BasicBehavior ):
         """ Actually Move """
         super().initialise()
         self.ctrl.close_gripper()
-        sleep( self.wait_s )
+        self.ctrl.wait_gripper( self.wait_s )
         
         
     def update( self ):
@@ -0,0 +1,107 @@
+"""
+async_gripper.py
+asyncio facade of Gripper, so finger motions can be awaited alongside arm motions.
+
+    gripper = AsyncGripper(Gripper(servoport))
+    await asyncio.gather(arm_travel(), gripper.set_goal_aperture(60.0, record_load=False))
+
+Register reads and writes are futures of the bus executor, wrapped for the event loop. Routines
+that sleep between transactions (motions, deligrasp, poke) run one at a time on a motion thread of
+their own, so they never hold the bus executor and telemetry keeps sampling while they run.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from magpie.ax12 import BusExecutor
+
+
+class AsyncGripper:
+    """ Coroutine versions of the Gripper commands.
+
+    Each coroutine takes the arguments of the Gripper method of the same name and returns its
+    result. Motions are queued in call order on the motion thread; cancelling the awaiting task
+    does not stop a motion already running, call stop() or set new goals for that.
+    """
+
+    def __init__(self, gripper):
+        self.gripper = gripper
+        self.bus = gripper.bus
+        self.motion = ThreadPoolExecutor(max_workers=1, thread_name_prefix="{}-motion".format(self.bus))
+        # whether a transaction of the facade started the bus executor, close() then stops it again
+        self.started_executor = False
+
+    def close(self):
+        """Wait for queued motions and end the motion thread, and the bus executor if the facade started it"""
+        self.motion.shutdown(wait=True)
+        if self.started_executor:
+            self.bus.stop_executor()
+            self.started_executor = False
+
+    async def run_motion(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.motion, lambda: func(*args, **kwargs))
+
+    async def transact(self, func, *args, priority=BusExecutor.PRIORITY_COMMAND):
+        # single transactions are awaited on the bus executor itself, submit() starts it on first use
+        if self.bus.executor is None:
+            self.started_executor = True
+        return await asyncio.wrap_future(self.bus.submit(func, *args, priority=priority))
+
+    # motions
+    async def set_goal_aperture(self, aperture, finger='both', **kwargs):
+        return await self.run_motion(self.gripper.set_goal_aperture, aperture, finger=finger, **kwargs)
+
+    async def open_gripper(self, settle=True, timeout=None):
+        return await self.run_motion(self.gripper.open_gripper, settle=settle, timeout=timeout)
+
+    async def close_gripper(self, settle=True, timeout=None):
+        return await self.run_motion(self.gripper.close_gripper, settle=settle, timeout=timeout)
+
+    async def deligrasp(self, x, fc, dx, df, complete=True, debug=False, **kwargs):
+        return await self.run_motion(self.gripper.deligrasp, x, fc, dx, df, complete=complete, debug=debug, **kwargs)
+
+    async def poke(self, direction, speed, aperture, debug=False):
+        return await self.run_motion(self.gripper.poke, direction, speed, aperture, debug=debug)
+
+    async def wait_until_settled(self, finger='both', timeout=None, **kwargs):
+        return await self.run_motion(self.gripper.wait_until_settled, finger=finger, timeout=timeout, **kwargs)
+
+    async def stop(self):
+        """Hold both fingers where they are now, ahead of any queued motion"""
+        positions = await self.get_position(finger='both', fresh=True)
+        return await self.transact(self.gripper.set_goal_position_both, *positions,
+                                   priority=BusExecutor.PRIORITY_EMERGENCY)
+
+    # reads
+    async def get_position(self, finger='both', fresh=False):
+        return await self.transact(self.gripper.get_position, finger, fresh,
+                                   priority=BusExecutor.PRIORITY_TELEMETRY)
+
+    async def get_aperture(self, finger='both', fresh=False):
+        return await self.transact(self.gripper.get_aperture, finger, fresh, priority=BusExecutor.PRIORITY_TELEMETRY)
+
+    async def read_state(self, finger='both', fresh=False):
+        return await self.transact(self.gripper.read_state, finger, fresh, priority=BusExecutor.PRIORITY_TELEMETRY)
+
+
+if __name__ == "__main__":
+    # pre-shape the simulated gripper while a stand-in arm move runs, then grasp
+    import time
+    from magpie.ax12 import Ax12
+    from magpie.dynamixel_sim import sim_bus, SpringContact
+    from magpie.gripper import Gripper
+    Ax12.DEBUG = False
+
+    async def main():
+        bus = sim_bus(positions={1: 303, 2: 729},
+                      contacts={1: SpringContact(420, 20.0, 1), 2: SpringContact(610, 20.0, -1)})
+        gripper = AsyncGripper(Gripper(bus=bus))
+        start = time.perf_counter()
+        await asyncio.gather(asyncio.sleep(1.0), gripper.set_goal_aperture(70.0, record_load=False))
+        print(f"arm travel and pre-shape: {time.perf_counter() - start:.3f} s, "
+              f"aperture {await gripper.get_aperture():.1f} mm")
+        print((await gripper.deligrasp(60.0, 1.0, 2.0, 0.25))[:2])
+        gripper.close()
+
+    asyncio.run(main())
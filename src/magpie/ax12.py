@@ -1,6 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import bisect
+import itertools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
 
 # Control table ADDRess for AX-12
@@ -58,6 +66,68 @@ ADDR_AX_LOCK = 47
 ADDR_AX_PUNCH_L = 48
 ADDR_AX_PUNCH_H = 49
 
+# registers the host can write; only these are mirrored in each motor's register shadow
+WRITABLE_REGISTERS = frozenset(
+    [reg for reg in range(ADDR_AX_ID, ADDR_AX_ALARM_SHUTDOWN + 1) if reg != ADDR_AX_SYSTEM_DATA2]
+    + list(range(ADDR_AX_TORQUE_ENABLE, ADDR_AX_TORQUE_LIMIT_H + 1))
+    + [ADDR_AX_LOCK, ADDR_AX_PUNCH_L, ADDR_AX_PUNCH_H])
+CONTROL_TABLE_LENGTH = ADDR_AX_PUNCH_H + 1
+# writing these does more than store the value, so they are only written on purpose
+SIDE_EFFECT_REGISTERS = (ADDR_AX_GOAL_POSITION_L, ADDR_AX_GOAL_POSITION_H)
+# the motor answers a read-back of these from another ID or baud rate
+UNVERIFIABLE_REGISTERS = (ADDR_AX_ID, ADDR_AX_BAUD_RATE)
+
+# AX-12 speed unit is about 0.111 rpm, and there are 1023 ticks per 300 degrees
+TICKS_PER_S_PER_SPEED_UNIT = 0.111 * 360.0 / 60.0 * 1023.0 / 300.0
+# baud rates the SDK PortHandler can open, with the AX-12 register value for each (2 Mbps / (value + 1))
+AX12_BAUD_REGISTER = {1_000_000: 1, 500_000: 3, 115_200: 16, 57_600: 34, 19_200: 103, 9_600: 207}
+
+# present-state block: position, speed, load, voltage and temperature (36-43)
+PRESENT_STATE_LENGTH = ADDR_AX_PRESENT_TEMPERATURE - ADDR_AX_PRESENT_POSITION_L + 1
+
+# protocol 1.0 packet: 0xFF 0xFF, ID, length, instruction or error, parameters..., checksum
+PACKET_OVERHEAD = 6
+# upper edges of the transaction latency histogram buckets in us, the last bucket is open-ended
+LATENCY_BUCKETS_US = (100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+
+def load_magnitude(load):
+    """Returns the magnitude of a raw present load (0-2047, 1024 and up being CCW), dropping the
+    direction bit the way Gripper.check_slip always has; element-wise over numpy arrays"""
+    return load - 1023 * (load > 1023)
+
+
+class WallClock:
+    """ Time source of timed loops, now() in seconds and sleep(); simulations substitute their own. """
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class Ax12State:
+    """ Snapshot of the present-state registers of one motor, decoded from a single block read.
+
+    """
+
+    __slots__ = ('id', 'position', 'speed', 'load', 'voltage', 'temperature')
+
+    def __init__(self, motor_id, data):
+        """Decode the raw bytes of registers 36-43"""
+        self.id = motor_id
+        self.position = data[0] | (data[1] << 8)
+        self.speed = data[2] | (data[3] << 8)
+        self.load = data[4] | (data[5] << 8)
+        self.voltage = data[6] / 10
+        self.temperature = data[7]
+
+    def __repr__(self):
+        return "Ax12State(id={}, position={}, speed={}, load={}, voltage={}, temperature={})".format(
+            self.id, self.position, self.speed, self.load, self.voltage, self.temperature)
+
 
 class Ax12:
     """ Class for Dynamixel AX12A motors.
@@ -68,36 +138,92 @@ class Ax12:
     BAUDRATE = 1_000_000  # Dynamixel default baudrate
     DEVICENAME = '/dev/ttyUSB0'  # e.g 'COM3' windows or '/dev/ttyUSB0' for linux
     DEBUG = True
+    # bus of motors created without one, opened by Ax12.connect()
+    default_bus = None
 
-    def __init__(self, motor_id):
-        """Initialize motor with id"""
+    def __init__(self, motor_id, bus=None):
+        """Initialize motor with id on `bus`, or on Ax12.default_bus if none is given"""
         self.id = motor_id
+        self.bus = bus if bus is not None else Ax12.default_bus
+        if self.bus is None:
+            raise RuntimeError("Ax12 ERROR: dxl ID: %d has no bus, pass a DynamixelBus or call Ax12.connect()" % motor_id)
+        # last byte known to be in each writable register, None when unknown
+        self.shadow = [None] * CONTROL_TABLE_LENGTH
 
     def __repr__(self):
         return "Ax12('{}')".format(self.id)
 
     # functions to read/write to registers
     def set_register1(self, reg_num, reg_value):
-        dxl_comm_result, dxl_error = Ax12.packetHandler.write1ByteTxRx(
-            Ax12.portHandler, self.id, reg_num, reg_value)
-        Ax12.check_error(dxl_comm_result, dxl_error)
+        self.write_register(reg_num, Ax12.to_bytes(reg_value, 1))
 
     def get_register1(self, reg_num):
-        reg_data, dxl_comm_result, dxl_error = Ax12.packetHandler.read1ByteTxRx(
-            Ax12.portHandler, self.id, reg_num)
-        Ax12.check_error(dxl_comm_result, dxl_error)
-        return reg_data
+        return self.read_register(reg_num, 1)[0]
 
     def set_register2(self, reg_num, reg_value):
-        dxl_comm_result, dxl_error = Ax12.packetHandler.write2ByteTxRx(
-            Ax12.portHandler, self.id, reg_num, reg_value)
-        Ax12.check_error(dxl_comm_result, dxl_error)
+        self.write_register(reg_num, Ax12.to_bytes(reg_value, 2))
 
     def get_register2(self, reg_num_low):
-        reg_data, dxl_comm_result, dxl_error = Ax12.packetHandler.read2ByteTxRx(
-            Ax12.portHandler, self.id, reg_num_low)
-        Ax12.check_error(dxl_comm_result, dxl_error)
-        return reg_data
+        data = self.read_register(reg_num_low, 2)
+        return data[0] | (data[1] << 8)
+
+    def write_register(self, reg_num, data):
+        """Write the bytes `data` from register `reg_num` on.
+        Skipped when the register shadow shows the motor already holds them."""
+        if self.shadow_matches(reg_num, data):
+            return
+        try:
+            self.bus.write(self.id, reg_num, data)
+        except RuntimeError:
+            # the motor state is uncertain after an error
+            self.invalidate_shadow()
+            raise
+        self.update_shadow(reg_num, data)
+        self.bus.verify_write(self, reg_num, data)
+
+    def read_register(self, reg_num, length):
+        """Returns the raw bytes of `length` registers from `reg_num` on."""
+        try:
+            data = self.bus.read(self.id, reg_num, length)
+        except RuntimeError:
+            self.invalidate_shadow()
+            raise
+        self.update_shadow(reg_num, data, written=False)
+        return data
+
+    def get_cached_register2(self, reg_num_low):
+        """Returns a register word from the shadow, reading it from the motor only if unknown."""
+        low, high = self.shadow[reg_num_low], self.shadow[reg_num_low + 1]
+        if low is None or high is None:
+            return self.get_register2(reg_num_low)
+        return low | (high << 8)
+
+    # register shadow
+    def shadow_matches(self, reg_num, data):
+        """Returns True if every byte of `data` is known to be in the registers from `reg_num` on.
+        A goal position write also switches the torque on, so it only matches while the torque is known to be on."""
+        if (reg_num <= ADDR_AX_GOAL_POSITION_H and ADDR_AX_GOAL_POSITION_L < reg_num + len(data)
+                and self.shadow[ADDR_AX_TORQUE_ENABLE] != 1):
+            return False
+        return all(self.shadow[reg_num + i] == byte for i, byte in enumerate(data))
+
+    def update_shadow(self, reg_num, data, written=True):
+        """Record bytes written to or read from the registers starting at `reg_num`."""
+        for i, byte in enumerate(data):
+            if reg_num + i in WRITABLE_REGISTERS:
+                self.shadow[reg_num + i] = byte
+        if written and reg_num <= ADDR_AX_GOAL_POSITION_H and ADDR_AX_GOAL_POSITION_L < reg_num + len(data):
+            # writing a goal position switches the torque on by itself
+            self.shadow[ADDR_AX_TORQUE_ENABLE] = None
+
+    def invalidate_shadow(self):
+        """Forget every cached register, e.g. after a power cycle; the next write of each goes to the bus."""
+        self.shadow = [None] * CONTROL_TABLE_LENGTH
+
+    def resync_shadow(self):
+        """Refill the register shadow from the motor with a single read of the whole control table."""
+        self.invalidate_shadow()
+        self.read_register(0, CONTROL_TABLE_LENGTH)
 
     # functions for Read-Only registers
     def get_model_number(self):
@@ -118,12 +244,16 @@ class Ax12:
 
     def get_temperature(self):
         """Returns internal temperature in units of Celsius."""
-        return self.get_register2(ADDR_AX_PRESENT_TEMPERATURE)
+        return self.get_register1(ADDR_AX_PRESENT_TEMPERATURE)
 
     def get_voltage(self):
         """Returns current voltage supplied to Motor in units of Volts."""
         return self.get_register1(ADDR_AX_PRESENT_VOLTAGE) / 10
 
+    def read_state(self):
+        """Returns an Ax12State with position, speed, load, voltage and temperature from one read."""
+        return Ax12State(self.id, self.read_register(ADDR_AX_PRESENT_POSITION_L, PRESENT_STATE_LENGTH))
+
     def is_registered(self):
         return self.get_register1(ADDR_AX_REGISTERED_INSTRUCTION)
 
@@ -131,6 +261,11 @@ class Ax12:
         """Returns 1 if motor is moving , 0 if not moving"""
         return self.get_register1(ADDR_AX_MOVING)
 
+    def read_motion(self):
+        """Returns (present position, moving flag) from one read of registers 36 to 46."""
+        data = self.read_register(ADDR_AX_PRESENT_POSITION_L, ADDR_AX_MOVING - ADDR_AX_PRESENT_POSITION_L + 1)
+        return data[0] | (data[1] << 8), data[-1]
+
     # functions for EEPROM Read/Write registers - stored in memory once changed
     def get_id(self):
         return self.get_register1(ADDR_AX_ID)
@@ -146,7 +281,7 @@ class Ax12:
         self.set_register1(ADDR_AX_BAUD_RATE, baudrate)
 
         if self.DEBUG:
-            self.print_status("Baudrate of ", self.id, self.get_baudrate())
+            self.print_status("Baudrate of ", self.id, baudrate)
 
     def get_return_delay_time(self):
         return self.get_register1(ADDR_AX_RETURN_DELAY_TIME)
@@ -161,7 +296,7 @@ class Ax12:
         """Sets the lower limit of motor angle [512-0]"""
         self.set_register2(ADDR_AX_CW_ANGLE_LIMIT_L, angle_limit)
         if self.DEBUG:
-            self.print_status("cw angle limit of ", self.id, self.get_cw_angle_limit())
+            self.print_status("cw angle limit of ", self.id, angle_limit)
 
     def get_ccw_angle_limit(self):
         return self.get_register2(ADDR_AX_CCW_ANGLE_LIMIT_L)
@@ -170,7 +305,7 @@ class Ax12:
         """Sets the upper limit of motor angle [512-1023]"""
         self.set_register2(ADDR_AX_CCW_ANGLE_LIMIT_L, angle_limit)
         if self.DEBUG:
-            self.print_status("ccw angle limit of ", self.id, self.get_ccw_angle_limit())
+            self.print_status("ccw angle limit of ", self.id, angle_limit)
 
     def get_min_voltage_limit(self):
         return self.get_register1(ADDR_AX_MIN_LIMIT_VOLTAGE)
@@ -206,7 +341,7 @@ class Ax12:
         return self.get_register1(ADDR_AX_ALARM_SHUTDOWN)
 
     def set_shutdown(self, shutdown_value):
-        self.get_register1(ADDR_AX_ALARM_SHUTDOWN, shutdown_value)
+        self.set_register1(ADDR_AX_ALARM_SHUTDOWN, shutdown_value)
 
     # functions for RAM Read/Write registers - resets after shutdown
     def get_torque_enable(self):
@@ -219,7 +354,7 @@ class Ax12:
         self.set_register1(ADDR_AX_TORQUE_ENABLE, torque_bool)
         
         if self.DEBUG: 
-            self.print_status("Torque enable ", self.id, self.get_torque_enable())
+            self.print_status("Torque enable ", self.id, torque_bool)
 
 
 
@@ -238,7 +373,7 @@ class Ax12:
         return self.get_register1(ADDR_AX_CCW_COMPLIANCE_MARGIN)
 
     def set_ccw_compliance_margin(self, comp_margin):
-        self.set_register1(ADDR_AX_CW_COMPLIANCE_MARGIN, comp_margin)
+        self.set_register1(ADDR_AX_CCW_COMPLIANCE_MARGIN, comp_margin)
 
     def get_cw_compliance_slope(self):
         return self.get_register1(ADDR_AX_CW_COMPLIANCE_SLOPE)
@@ -250,7 +385,7 @@ class Ax12:
         return self.get_register1(ADDR_AX_CCW_COMPLIANCE_SLOPE)
 
     def set_ccw_compliance_slope(self, comp_slope):
-        self.set_register1(ADDR_AX_CW_COMPLIANCE_SLOPE, comp_slope)
+        self.set_register1(ADDR_AX_CCW_COMPLIANCE_SLOPE, comp_slope)
 
     def get_goal_position(self):
         return self.get_register2(ADDR_AX_GOAL_POSITION_L)
@@ -260,7 +395,7 @@ class Ax12:
         self.set_register2(ADDR_AX_GOAL_POSITION_L, goal_pos)
 
         if self.DEBUG: 
-            self.print_status("Position of ", self.id, self.get_goal_position())
+            self.print_status("Position of ", self.id, goal_pos)
 
     def get_moving_speed(self):
         """Returns moving speed to goal position [0-1023]."""
@@ -271,7 +406,7 @@ class Ax12:
         self.set_register2(ADDR_AX_GOAL_SPEED_L, moving_speed)
         
         if self.DEBUG:
-            self.print_status("Moving speed of ", self.id, self.get_moving_speed())
+            self.print_status("Moving speed of ", self.id, moving_speed)
 
 
     def get_torque_limit(self):
@@ -308,53 +443,673 @@ class Ax12:
 
 
     @classmethod
-    def open_port(cls):
-        cls.portHandler = PortHandler(cls.DEVICENAME)
-        if cls.portHandler.openPort():
+    def connect(cls):
+        """Open Ax12.default_bus on DEVICENAME at BAUDRATE"""
+        cls.default_bus = DynamixelBus(cls.DEVICENAME, cls.BAUDRATE)
+        cls.default_bus.connect()
+
+    @classmethod
+    def disconnect(cls):
+        cls.default_bus.disconnect()
+
+    @staticmethod
+    def to_bytes(value, data_length):
+        """Split `value` into `data_length` little-endian bytes, as the control table stores them."""
+        value = int(value)
+        return [(value >> (8 * i)) & 0xFF for i in range(data_length)]
+
+    @staticmethod
+    def raw2deg(delta_raw):
+        return round(delta_raw*(300/1023),2)
+
+    @staticmethod
+    def deg2raw(delta_deg):
+        return int(delta_deg*(1023/300))
+
+    @staticmethod
+    def print_status(dxl_property, dxl_id, value):
+            print(dxl_property +  "dxl ID: %d set to %d " % (dxl_id, value))
+
+
+class DynamixelBus:
+    """ One serial port and packet handler, shared by the motors chained on it.
+
+    Every Ax12 talks through the bus it was created with, so several buses on separate
+    ports can be driven from separate threads of one process.
+    """
+
+    PROTOCOL_VERSION = 1.0
+    # write verification policy: read back no writes, one in every verify_every writes, or all of them
+    VERIFY_NONE = 'none'
+    VERIFY_SAMPLED = 'sampled'
+    VERIFY_ALWAYS = 'always'
+
+    def __init__(self, devicename='/dev/ttyUSB0', baudrate=1_000_000, port_handler=None):
+        """Store port settings, `port_handler` replaces the serial PortHandler opened by connect()"""
+        self.devicename = devicename
+        self.baudrate = baudrate
+        self.portHandler = port_handler
+        self.packetHandler = PacketHandler(self.PROTOCOL_VERSION)
+        # AX-12 firmware does not answer BULK_READ (MX-series only), set True for chains that do
+        self.bulk_read = False
+        self.verify = DynamixelBus.VERIFY_SAMPLED
+        self.verify_every = 100
+        self.reset_verify_stats()
+        # BusExecutor that owns the port once started, None while callers use the port directly
+        self.executor = None
+        # {dxl ID: (servo, reg_num, data)} registered with REG_WRITE and waiting for action()
+        self.staged = {}
+        self.stats = BusStats(str(self))
+        self.retry = RetryPolicy()
+        # {dxl ID: CircuitBreaker}, created on first use
+        self.breakers = {}
+
+    def __repr__(self):
+        return "DynamixelBus('{}')".format(self.devicename)
+
+    def open_port(self):
+        if self.portHandler is None:
+            self.portHandler = PortHandler(self.devicename)
+        if self.portHandler.openPort():
             print("Succeeded to open the port")
         else:
             print("Failed to open the port")
             print("Press any key to terminate...")
             quit()
 
-    @classmethod
-    def set_baudrate(cls):
-        if cls.portHandler.setBaudRate(cls.BAUDRATE):
+    def set_port_baudrate(self, baudrate=None):
+        if baudrate is not None:
+            self.baudrate = baudrate
+        if self.transact(BusExecutor.PRIORITY_COMMAND, self.portHandler.setBaudRate, self.baudrate):
             print("Succeeded to change the baudrate")
         else:
             print("Failed to change the baudrate")
             print("Press any key to terminate...")
             quit()
 
-    @classmethod
-    def connect(cls):
-        cls.open_port()
-        cls.set_baudrate()
-        cls.packetHandler = PacketHandler(cls.PROTOCOL_VERSION)
+    def connect(self):
+        self.open_port()
+        self.set_port_baudrate()
 
-    @classmethod
-    def disconnect(cls):
+    def disconnect(self):
+        self.stop_executor()
         # Close port
-        cls.portHandler.closePort()
+        self.portHandler.closePort()
         print('Successfully closed port')
 
-    @staticmethod
-    def check_error( comm_result, dxl_err ):
+    def check_error(self, comm_result, dxl_err):
         if comm_result != COMM_SUCCESS:
-            # print("%s" % Ax12.packetHandler.getTxRxResult(comm_result))
-            raise RuntimeError( "Ax12 Comm ERROR: %s" % Ax12.packetHandler.getTxRxResult(comm_result) )
+            raise RuntimeError( "Ax12 Comm ERROR: %s" % self.packetHandler.getTxRxResult(comm_result) )
         elif dxl_err != 0:
-            raise RuntimeError( "Ax12 Servo ERROR: %s" % Ax12.packetHandler.getRxPacketError( dxl_err ) )
-            # print("%s" % Ax12.packetHandler.getRxPacketError(dxl_err))
+            raise RuntimeError( "Ax12 Servo ERROR: %s" % self.packetHandler.getRxPacketError( dxl_err ) )
+
+    # executor thread
+    def start_executor(self):
+        """Hand the port to a BusExecutor thread, after which the bus is safe to share between threads."""
+        if self.executor is None:
+            self.executor = BusExecutor(self)
+            self.executor.start()
+        return self.executor
+
+    def stop_executor(self):
+        """Finish queued transactions and give the port back to direct calls."""
+        if self.executor is not None:
+            self.executor.stop()
+            self.executor = None
+
+    def submit(self, func, *args, priority=None):
+        """Returns a Future of `func(*args)` run on the executor thread, starting the executor if needed."""
+        priority = BusExecutor.PRIORITY_COMMAND if priority is None else priority
+        return self.start_executor().submit(func, *args, priority=priority)
+
+    def transact(self, priority, func, *args):
+        """Run `func(*args)` on the executor thread if one owns the port, otherwise right here."""
+        executor = self.executor
+        if executor is None or executor.in_thread():
+            return func(*args)
+        return executor.submit(func, *args, priority=priority).result()
+
+    # single-motor transactions
+    def read(self, dxl_id, reg_num, length, priority=None):
+        """Returns the raw bytes of `length` registers of motor `dxl_id` from `reg_num` on."""
+        priority = BusExecutor.PRIORITY_TELEMETRY if priority is None else priority
+        return self.transact(priority, self.read_now, dxl_id, reg_num, length)
+
+    def write(self, dxl_id, reg_num, data, priority=None):
+        """Write the bytes `data` to motor `dxl_id` from register `reg_num` on."""
+        executor = self.executor
+        if executor is None or executor.in_thread():
+            return self.write_now(dxl_id, reg_num, data)
+        if priority is None:
+            # switching torque is how motion is stopped, so it jumps the queue
+            priority = (BusExecutor.PRIORITY_EMERGENCY if reg_num == ADDR_AX_TORQUE_ENABLE
+                        else BusExecutor.PRIORITY_COMMAND)
+        return executor.submit_write(dxl_id, reg_num, data, priority=priority).result()
+
+    def breaker(self, dxl_id):
+        breaker = self.breakers.get(dxl_id)
+        if breaker is None:
+            breaker = self.breakers[dxl_id] = CircuitBreaker()
+        return breaker
+
+    def reset_breakers(self):
+        self.breakers = {}
+
+    def exchange(self, instruction, dxl_id, reg_num, tx_bytes, rx_bytes, txrx):
+        """Run the packet exchange `txrx()`, which returns (data, comm result, dxl error), under the retry
+        policy and the circuit breaker of `dxl_id`. Every attempt is recorded in stats, comm failures are
+        retried if the instruction is safe to repeat, and the last failure is raised."""
+        breaker = self.breaker(dxl_id)
+        breaker.check(dxl_id)
+        retryable = self.retry.retryable(instruction, reg_num)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            data, dxl_comm_result, dxl_error = txrx()
+            self.stats.record(instruction, dxl_id, reg_num, time.perf_counter() - start, tx_bytes, rx_bytes,
+                              dxl_comm_result, dxl_error, self.packetHandler)
+            # a servo error means the servo answered, repeating the packet would not change it
+            if dxl_comm_result == COMM_SUCCESS:
+                breaker.success()
+                break
+            breaker.failure()
+            attempt += 1
+            if not retryable or attempt >= self.retry.attempts or breaker.is_open():
+                break
+            self.stats.count_retry(dxl_id, reg_num)
+            time.sleep(self.retry.backoff(attempt))
+        self.check_error(dxl_comm_result, dxl_error)
+        return data
+
+    def read_now(self, dxl_id, reg_num, length):
+        return self.exchange('READ', dxl_id, reg_num, PACKET_OVERHEAD + 2, PACKET_OVERHEAD + length,
+                             lambda: self.packetHandler.readTxRx(self.portHandler, dxl_id, reg_num, length))
+
+    def write_now(self, dxl_id, reg_num, data):
+        self.exchange('WRITE', dxl_id, reg_num, PACKET_OVERHEAD + 1 + len(data), PACKET_OVERHEAD,
+                      lambda: (None,) + self.packetHandler.writeTxRx(
+                          self.portHandler, dxl_id, reg_num, len(data), data))
+
+    def sync_write_ids(self, dxl_ids, reg_num, data_length, datas):
+        """Send one SyncWrite of the byte lists `datas` to motors `dxl_ids`, without touching any shadow."""
+        group = GroupSyncWrite(self.portHandler, self.packetHandler, reg_num, data_length)
+        for dxl_id, data in zip(dxl_ids, datas):
+            if not group.addParam(dxl_id, data):
+                raise RuntimeError("Ax12 SyncWrite ERROR: could not add dxl ID: %d" % dxl_id)
+        # broadcast, so no status packet comes back
+        self.exchange('SYNC_WRITE', BROADCAST_ID, reg_num, PACKET_OVERHEAD + 2 + len(dxl_ids) * (1 + data_length), 0,
+                      lambda: (None, group.txPacket(), 0))
+
+    # functions that address several motors with one packet
+    def sync_write(self, servos, reg_num, data_length, values):
+        """Write one value per servo to the same register(s) with a single SyncWrite packet.
+        SyncWrite is broadcast, so no status packets are returned. Servos whose register
+        shadow already holds the value are left out, and nothing is sent if none are left."""
+        pending = [(servo, Ax12.to_bytes(value, data_length)) for servo, value in zip(servos, values)]
+        pending = [(servo, data) for servo, data in pending if not servo.shadow_matches(reg_num, data)]
+        if not pending:
+            return
+        try:
+            self.transact(BusExecutor.PRIORITY_COMMAND, self.sync_write_ids,
+                          [servo.id for servo, _ in pending], reg_num, data_length,
+                          [data for _, data in pending])
+        except RuntimeError:
+            for servo, _ in pending:
+                servo.invalidate_shadow()
+            raise
+        for servo, data in pending:
+            servo.update_shadow(reg_num, data)
+            self.verify_write(servo, reg_num, data)
+
+    def sync_write_changes(self, servos, registers, max_gap=2):
+        """Bring several servos' registers to the bytes in `registers`, one {reg_num: byte} dict per
+        servo over the same registers, with as few SyncWrites as the register shadows allow.
+        Registers every shadow already holds are not sent. Changed registers at most `max_gap` apart
+        share one SyncWrite, with the registers in between rewritten from the shadows when all of
+        them are known there; a goal position is never filled in, since writing it turns the torque on.
+        Returns the number of SyncWrites sent."""
+        changed = sorted({reg for servo, regs in zip(servos, registers)
+                          for reg, byte in regs.items() if servo.shadow[reg] != byte})
+        spans = []
+        for reg in changed:
+            if spans and reg - spans[-1][1] - 1 <= max_gap and all(
+                    gap in regs or (servo.shadow[gap] is not None and gap not in SIDE_EFFECT_REGISTERS)
+                    for servo, regs in zip(servos, registers) for gap in range(spans[-1][1] + 1, reg)):
+                spans[-1][1] = reg
+            else:
+                spans.append([reg, reg])
+        for start, end in spans:
+            values = [sum(regs.get(reg, servo.shadow[reg]) << (8 * (reg - start)) for reg in range(start, end + 1))
+                      for servo, regs in zip(servos, registers)]
+            self.sync_write(servos, start, end - start + 1, values)
+        return len(spans)
+
+    def sync_set_goal_position(self, servos, goal_positions, moving_speeds=None, torque_limits=None):
+        """Write goal position, and optionally moving speed and torque limit, of several servos at once.
+        Goal position, moving speed and torque limit are consecutive registers (30-35), so when all
+        are given they are sent as one 6-byte SyncWrite and every servo starts moving together."""
+        words = [goal_positions]
+        if moving_speeds is not None:
+            words.append(moving_speeds)
+            if torque_limits is not None:
+                words.append(torque_limits)
+        elif torque_limits is not None:
+            self.sync_write(servos, ADDR_AX_TORQUE_LIMIT_L, 2, torque_limits)
+        # pack each servo's consecutive words into one little-endian value
+        values = [sum(int(word[i]) << (16 * j) for j, word in enumerate(words)) for i in range(len(servos))]
+        self.sync_write(servos, ADDR_AX_GOAL_POSITION_L, 2 * len(words), values)
+
+        if Ax12.DEBUG:
+            for servo, goal_pos in zip(servos, goal_positions):
+                Ax12.print_status("Position of ", servo.id, goal_pos)
+
+    # staged motion: REG_WRITE now, one broadcast ACTION later
+    def stage_goal_position(self, servos, goal_positions, moving_speeds=None, torque_limits=None):
+        """Register goal position, and optionally moving speed and torque limit, in each servo with
+        REG_WRITE; nothing moves until action(). A servo holds one registered instruction, so the
+        values go as one block from register 30 and replace anything staged on it before."""
+        for i, servo in enumerate(servos):
+            words = [goal_positions[i]]
+            if moving_speeds is not None or torque_limits is not None:
+                words.append(moving_speeds[i] if moving_speeds is not None
+                             else servo.get_cached_register2(ADDR_AX_GOAL_SPEED_L))
+            if torque_limits is not None:
+                words.append(torque_limits[i])
+            data = Ax12.to_bytes(sum(int(word) << (16 * j) for j, word in enumerate(words)), 2 * len(words))
+            self.stage(servo, ADDR_AX_GOAL_POSITION_L, data)
+
+    def stage(self, servo, reg_num, data):
+        """REG_WRITE the bytes `data` from register `reg_num` on, skipped if the shadow already holds them
+        and nothing is staged on the servo, whose registered write would otherwise still run on action()."""
+        if servo.id not in self.staged and servo.shadow_matches(reg_num, data):
+            return
+        try:
+            self.transact(BusExecutor.PRIORITY_COMMAND, self.reg_write_now, servo.id, reg_num, data)
+        except RuntimeError:
+            servo.invalidate_shadow()
+            raise
+        self.staged[servo.id] = (servo, reg_num, data)
+
+    def reg_write_now(self, dxl_id, reg_num, data):
+        self.exchange('REG_WRITE', dxl_id, reg_num, PACKET_OVERHEAD + 1 + len(data), PACKET_OVERHEAD,
+                      lambda: (None,) + self.packetHandler.regWriteTxRx(
+                          self.portHandler, dxl_id, reg_num, len(data), data))
+
+    def action(self):
+        """Start every staged write at once with a single broadcast ACTION."""
+        self.transact(BusExecutor.PRIORITY_COMMAND, self.action_now)
+        for servo, reg_num, data in self.staged.values():
+            servo.update_shadow(reg_num, data)
+        self.staged = {}
+
+    def action_now(self):
+        self.exchange('ACTION', BROADCAST_ID, None, PACKET_OVERHEAD, 0,
+                      lambda: (None, self.packetHandler.action(self.portHandler, BROADCAST_ID), 0))
+
+    def read_states(self, servos):
+        """Returns one Ax12State per servo.
+        With bulk_read, every servo answers a single BulkRead instruction; otherwise each servo
+        gets one block read of its present-state registers."""
+        if not self.bulk_read:
+            return [servo.read_state() for servo in servos]
+        return self.transact(BusExecutor.PRIORITY_TELEMETRY, self.bulk_read_states, servos)
+
+    def bulk_read_states(self, servos):
+        group = GroupBulkRead(self.portHandler, self.packetHandler)
+        for servo in servos:
+            group.addParam(servo.id, ADDR_AX_PRESENT_POSITION_L, PRESENT_STATE_LENGTH)
+        self.exchange('BULK_READ', BROADCAST_ID, ADDR_AX_PRESENT_POSITION_L, PACKET_OVERHEAD + 1 + 3 * len(servos),
+                      len(servos) * (PACKET_OVERHEAD + PRESENT_STATE_LENGTH), lambda: (None, group.txRxPacket(), 0))
+        states = []
+        for servo in servos:
+            if not group.isAvailable(servo.id, ADDR_AX_PRESENT_POSITION_L, PRESENT_STATE_LENGTH):
+                raise RuntimeError("Ax12 BulkRead ERROR: no data from dxl ID: %d" % servo.id)
+            states.append(Ax12State(servo.id, group.data_dict[servo.id][0]))
+        return states
+
+    # write verification
+    def verify_write(self, servo, reg_num, data):
+        """Read back a write according to the verify policy and count mismatches instead of raising."""
+        self.write_count += 1
+        if self.verify == DynamixelBus.VERIFY_NONE or reg_num in UNVERIFIABLE_REGISTERS:
+            return
+        if self.verify == DynamixelBus.VERIFY_SAMPLED and self.write_count % self.verify_every:
+            return
+        # the read-back also corrects the servo's register shadow
+        reg_data = servo.read_register(reg_num, len(data))
+        self.verify_count += 1
+        if list(reg_data) != list(data):
+            key = (servo.id, reg_num)
+            self.verify_mismatches[key] = self.verify_mismatches.get(key, 0) + 1
+
+    def get_verify_stats(self):
+        """Returns write and read-back counts, and mismatches by (dxl ID, register)."""
+        return {'policy': self.verify,
+                'writes': self.write_count,
+                'verified': self.verify_count,
+                'mismatches': sum(self.verify_mismatches.values()),
+                'mismatches_by_register': dict(self.verify_mismatches)}
+
+    def reset_verify_stats(self):
+        self.write_count = 0
+        self.verify_count = 0
+        # {(dxl ID, register): number of read-backs that did not match the written value}
+        self.verify_mismatches = {}
+
+
+class BusExecutor:
+    """ Thread that owns the serial port of a DynamixelBus.
+
+    Transactions are queued from any thread and run one at a time in priority order, so packets
+    from different threads never interleave. Consecutive queued writes to the same registers of
+    different motors are sent together as one SyncWrite.
+    """
 
-    @staticmethod
-    def raw2deg(delta_raw):
-        return round(delta_raw*(300/1023),2)
+    PRIORITY_EMERGENCY = 0  # stopping motion, torque off
+    PRIORITY_COMMAND = 1  # motion and parameter writes
+    PRIORITY_TELEMETRY = 2  # state polls
+    PRIORITY_SHUTDOWN = 3  # runs after everything queued before it
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = queue.PriorityQueue()
+        # tie-breaker, keeps equal-priority requests in arrival order
+        self.counter = itertools.count()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="{}-executor".format(self.bus), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Run everything already queued, then end the thread."""
+        if self.thread is None:
+            return
+        self.submit(None, priority=BusExecutor.PRIORITY_SHUTDOWN)
+        if not self.in_thread():
+            self.thread.join()
+        self.thread = None
+
+    def in_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, func, *args, priority=PRIORITY_COMMAND):
+        """Returns a Future of `func(*args)` run on the executor thread."""
+        future = Future()
+        self.queue.put((priority, next(self.counter), 'call', (func, args), future))
+        return future
+
+    def submit_write(self, dxl_id, reg_num, data, priority=PRIORITY_COMMAND):
+        """Returns a Future of a register write, which may be merged with its neighbours into a SyncWrite."""
+        future = Future()
+        self.queue.put((priority, next(self.counter), 'write', (dxl_id, reg_num, data), future))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            # take whatever else is waiting, already in priority order
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            i = 0
+            while i < len(batch):
+                priority, _, kind, payload, future = batch[i]
+                if kind == 'call' and payload[0] is None:
+                    # shutdown, only later shutdowns can be queued behind it
+                    for item in batch[i:]:
+                        item[4].set_result(None)
+                    return
+                if kind == 'write':
+                    group = self.coalesce(batch, i)
+                    self.run_writes(group)
+                    i += len(group)
+                    continue
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(payload[0](*payload[1]))
+                    except BaseException as e:
+                        future.set_exception(e)
+                i += 1
 
     @staticmethod
-    def deg2raw(delta_deg):
-        return int(delta_deg*(1023/300))
+    def coalesce(batch, i):
+        """Returns the run of writes from batch[i] on that target the same registers of distinct motors."""
+        priority, _, _, (dxl_id, reg_num, data), _ = batch[i]
+        group = [batch[i]]
+        ids = {dxl_id}
+        for item in batch[i + 1:]:
+            if item[0] != priority or item[2] != 'write':
+                break
+            other_id, other_reg, other_data = item[3]
+            if other_reg != reg_num or len(other_data) != len(data) or other_id in ids:
+                break
+            group.append(item)
+            ids.add(other_id)
+        return group
+
+    def run_writes(self, group):
+        group = [item for item in group if item[4].set_running_or_notify_cancel()]
+        if not group:
+            return
+        futures = [item[4] for item in group]
+        try:
+            if len(group) == 1:
+                self.bus.write_now(*group[0][3])
+            else:
+                _, reg_num, data = group[0][3]
+                self.bus.sync_write_ids([item[3][0] for item in group], reg_num, len(data),
+                                        [item[3][2] for item in group])
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(None)
+
+
+class RetryPolicy:
+    """ How a DynamixelBus repeats a packet exchange that got no valid status back.
+
+    Up to `attempts` tries in all, with an exponential backoff from backoff_us up to max_backoff_us
+    between them, each delay shortened by a random fraction of up to `jitter` so that retries from
+    several threads do not line up. Reads and writes of absolute values are safe to repeat. ACTION
+    is not, and neither are writes to ID or baud rate, which a servo may have applied before its
+    status packet was lost.
+    """
+
+    NOT_RETRYABLE = ('ACTION',)
+
+    def __init__(self, attempts=3, backoff_us=500, max_backoff_us=5000, jitter=0.5):
+        self.attempts = attempts
+        self.backoff_us = backoff_us
+        self.max_backoff_us = max_backoff_us
+        self.jitter = jitter
+
+    def retryable(self, instruction, reg_num):
+        if instruction in RetryPolicy.NOT_RETRYABLE:
+            return False
+        return instruction == 'READ' or instruction == 'BULK_READ' or reg_num not in UNVERIFIABLE_REGISTERS
+
+    def backoff(self, attempt):
+        """Returns the delay in seconds after failed attempt number `attempt` (from 1)"""
+        delay_us = min(self.backoff_us * 2 ** (attempt - 1), self.max_backoff_us)
+        return delay_us * (1.0 - self.jitter * random.random()) * 1e-6
+
+
+class CircuitBreaker:
+    """ Fails fast on a servo that stopped answering.
+
+    After `threshold` failed exchanges in a row the breaker opens and every request to the servo
+    raises at once for reset_s seconds. Then one request is let through: success closes the
+    breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_s=0.5):
+        self.threshold = threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def check(self, dxl_id):
+        if self.opened_at is None:
+            return
+        if time.perf_counter() - self.opened_at < self.reset_s:
+            raise RuntimeError("Ax12 Circuit OPEN: dxl ID %d failed %d times in a row" % (dxl_id, self.failures))
+        # half open, a single failure opens it again
+        self.opened_at = None
+        self.failures = self.threshold - 1
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.perf_counter()
+
+
+class BusStats:
+    """ Transaction counters of one DynamixelBus.
+
+    Every packet exchange records its latency in a histogram per instruction and start register,
+    its bytes on the wire, and any comm or servo error by type and dxl ID. Callers that retry a
+    failed transaction count it with count_retry(), and set_phase() labels the transactions that
+    follow so that slow phases of a routine stand out. With log_interval set, a summary is passed
+    to `log` every log_interval seconds from the thread that records.
+    """
+
+    def __init__(self, name='bus', log_interval=None, log=print):
+        self.name = name
+        self.enabled = True
+        self.log_interval = log_interval
+        self.log = log
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start_time = time.perf_counter()
+            self.last_log = self.start_time
+            self.phase = None
+            self.transactions = 0
+            self.tx_bytes = 0
+            self.rx_bytes = 0
+            # {(instruction, reg_num): [count, total s, max s, bucket counts]}
+            self.latency = {}
+            # {phase: [count, total s]}
+            self.phases = {}
+            # {error text: count} and {dxl ID: count}
+            self.errors = {}
+            self.errors_by_id = {}
+            # {(dxl ID, reg_num): count}
+            self.retries = {}
+
+    def set_phase(self, phase):
+        """Label the following transactions with `phase`, returns the previous label"""
+        previous, self.phase = self.phase, phase
+        return previous
+
+    def record(self, instruction, dxl_id, reg_num, elapsed, tx_bytes, rx_bytes, comm_result, dxl_err,
+               packet_handler=None):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.transactions += 1
+            self.tx_bytes += tx_bytes
+            entry = self.latency.get((instruction, reg_num))
+            if entry is None:
+                entry = self.latency[(instruction, reg_num)] = [0, 0.0, 0.0, [0] * (len(LATENCY_BUCKETS_US) + 1)]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            entry[3][bisect.bisect_left(LATENCY_BUCKETS_US, elapsed * 1e6)] += 1
+            phase = self.phases.get(self.phase)
+            if phase is None:
+                phase = self.phases[self.phase] = [0, 0.0]
+            phase[0] += 1
+            phase[1] += elapsed
+            if comm_result != COMM_SUCCESS:
+                error = ("comm: " + packet_handler.getTxRxResult(comm_result) if packet_handler
+                         else "comm: %d" % comm_result)
+            elif dxl_err != 0:
+                error = ("servo: " + packet_handler.getRxPacketError(dxl_err) if packet_handler
+                         else "servo: %d" % dxl_err)
+            else:
+                # a status packet only came back if the exchange succeeded
+                self.rx_bytes += rx_bytes
+                error = None
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+                self.errors_by_id[dxl_id] = self.errors_by_id.get(dxl_id, 0) + 1
+        if self.log_interval is not None and time.perf_counter() - self.last_log >= self.log_interval:
+            self.last_log = time.perf_counter()
+            for line in self.format_lines():
+                self.log(line)
+
+    def count_retry(self, dxl_id, reg_num=None):
+        with self.lock:
+            self.retries[(dxl_id, reg_num)] = self.retries.get((dxl_id, reg_num), 0) + 1
 
     @staticmethod
-    def print_status(dxl_property, dxl_id, value):
-            print(dxl_property +  "dxl ID: %d set to %d " % (dxl_id, value))
+    def percentile_us(buckets, q):
+        """Returns the upper edge of the bucket holding quantile `q`, inf for the open-ended bucket"""
+        target = q * sum(buckets)
+        seen = 0
+        for edge, count in zip(LATENCY_BUCKETS_US + (float('inf'),), buckets):
+            seen += count
+            if count and seen >= target:
+                return edge
+        return float('nan')
+
+    def snapshot(self):
+        """Returns a copy of every counter as plain dicts, latencies in us"""
+        with self.lock:
+            elapsed = time.perf_counter() - self.start_time
+            latency = {}
+            for (instruction, reg_num), (count, total, worst, buckets) in sorted(
+                    self.latency.items(), key=lambda item: (item[0][0], -1 if item[0][1] is None else item[0][1])):
+                latency[(instruction, reg_num)] = {
+                    'count': count,
+                    'mean_us': total / count * 1e6,
+                    'max_us': worst * 1e6,
+                    'p50_us': self.percentile_us(buckets, 0.50),
+                    'p99_us': self.percentile_us(buckets, 0.99),
+                    'histogram': list(buckets),
+                }
+            return {'name': self.name,
+                    'elapsed_s': elapsed,
+                    'transactions': self.transactions,
+                    'tx_bytes': self.tx_bytes,
+                    'rx_bytes': self.rx_bytes,
+                    'bucket_edges_us': LATENCY_BUCKETS_US,
+                    'latency': latency,
+                    'phases': {phase: {'count': count, 'total_s': total}
+                               for phase, (count, total) in self.phases.items()},
+                    'errors': dict(self.errors),
+                    'errors_by_id': dict(self.errors_by_id),
+                    'retries': dict(self.retries)}
+
+    def format_lines(self):
+        """Returns the snapshot as log lines: a summary, then one line per instruction and register"""
+        snap = self.snapshot()
+        elapsed = max(snap['elapsed_s'], 1e-9)
+        lines = ["{}: {} transactions in {:.1f} s, tx {:.0f} B/s, rx {:.0f} B/s, {} errors, {} retries".format(
+            snap['name'], snap['transactions'], elapsed, snap['tx_bytes'] / elapsed, snap['rx_bytes'] / elapsed,
+            sum(snap['errors'].values()), sum(snap['retries'].values()))]
+        for (instruction, reg_num), row in snap['latency'].items():
+            lines.append("{}:   {:<10} reg {:>4} n={:<6} mean {:7.0f} us  p50 <{:>6} us  p99 <{:>6} us  max {:7.0f} us".format(
+                snap['name'], instruction, '-' if reg_num is None else reg_num, row['count'], row['mean_us'],
+                row['p50_us'], row['p99_us'], row['max_us']))
+        for phase, row in snap['phases'].items():
+            lines.append("{}:   phase {:<12} n={:<6} bus time {:.3f} s".format(
+                snap['name'], str(phase), row['count'], row['total_s']))
+        for error, count in snap['errors'].items():
+            lines.append("{}:   error {} x{}".format(snap['name'], error, count))
+        return lines
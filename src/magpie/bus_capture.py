@@ -0,0 +1,242 @@
+"""
+bus_capture.py
+Record the raw packets of a Dynamixel port and play a recording back in place of the port.
+
+    bus = capture_bus('/dev/ttyACM0')
+    gripper = Gripper(bus=bus)
+    gripper.deligrasp(...)
+    bus.portHandler.save('deligrasp.npz')
+
+    gripper = Gripper(bus=replay_bus('deligrasp.npz'))
+    gripper.deligrasp(...)  # same arguments, same status packets, no hardware
+
+Replay answers every instruction packet with the recorded status bytes, at the recorded delay
+after it when `realtime` is set, so the same calls take the same path through Ax12, Gripper and
+the grasp routines and their cycle time can be compared against the field run.
+"""
+
+import time
+
+import numpy as np
+
+from dynamixel_sdk import *  # Uses Dynamixel SDK library
+
+from magpie.ax12 import DynamixelBus
+
+# event kinds: instruction packet written, status bytes read, read given up after the packet timeout
+EVENT_TX = 0
+EVENT_RX = 1
+EVENT_TIMEOUT = 2
+EVENT_NAMES = ('tx', 'rx', 'timeout')
+
+
+class CapturePortHandler:
+    """ Wraps a PortHandler and records the bytes that go through it.
+
+    Every written packet, every non-empty read and every packet timeout is kept as
+    (time since start [s], kind, bytes); save() writes them to an .npz file for ReplayPortHandler.
+    """
+
+    def __init__(self, port_handler):
+        self.port = port_handler
+        self.is_using = False
+        self.start_time = time.perf_counter()
+        self.events = []
+
+    def __getattr__(self, name):
+        # the rest of the PortHandler interface goes straight to the wrapped port
+        return getattr(self.port, name)
+
+    def record(self, kind, data=b''):
+        self.events.append((time.perf_counter() - self.start_time, kind, bytes(data)))
+
+    def writePort(self, packet):
+        self.record(EVENT_TX, packet)
+        return self.port.writePort(packet)
+
+    def readPort(self, length):
+        data = self.port.readPort(length)
+        if data:
+            self.record(EVENT_RX, data)
+        return data
+
+    def isPacketTimeout(self):
+        if self.port.isPacketTimeout():
+            self.record(EVENT_TIMEOUT)
+            return True
+        return False
+
+    def save(self, path):
+        """Write the recording to `path` as arrays time, kind, length and the concatenated data bytes"""
+        save_events(path, self.events)
+
+
+class ReplayPortHandler:
+    """ Stand-in for dynamixel_sdk.PortHandler that answers from a recording.
+
+    Written packets are checked against the recorded ones; with `strict` a different packet
+    raises RuntimeError, otherwise it is counted in `mismatches` and replay carries on. With
+    `realtime` each status byte is held back until the recorded delay after its instruction.
+    """
+
+    def __init__(self, events, port_name='replay', strict=True, realtime=True):
+        """`events` is a list of (time, kind, bytes), e.g. from load_events()"""
+        self.events = events
+        self.port_name = port_name
+        self.strict = strict
+        self.realtime = realtime
+        self.is_using = False
+        self.baudrate = DEFAULT_BAUDRATE
+        self.index = 0
+        # unread rest of a recorded rx chunk
+        self.pending = b''
+        # perf_counter time at which the current instruction was recorded
+        self.offset = 0.0
+        self.mismatches = 0
+
+    # PortHandler interface
+    def openPort(self):
+        return True
+
+    def closePort(self):
+        pass
+
+    def clearPort(self):
+        pass
+
+    def setPortName(self, port_name):
+        self.port_name = port_name
+
+    def getPortName(self):
+        return self.port_name
+
+    def setBaudRate(self, baudrate):
+        self.baudrate = baudrate
+        return True
+
+    def getBaudRate(self):
+        return self.baudrate
+
+    def getBytesAvailable(self):
+        return len(self.pending) + (len(self.peek()[2]) if self.peek_kind() == EVENT_RX else 0)
+
+    def setPacketTimeout(self, packet_length):
+        pass
+
+    def setPacketTimeoutMillis(self, msec):
+        pass
+
+    def writePort(self, packet):
+        packet = bytes(packet)
+        self.pending = b''
+        # skip reads the host gave up on, e.g. rest of a corrupt status packet
+        while self.peek_kind() in (EVENT_RX, EVENT_TIMEOUT):
+            self.index += 1
+        if self.peek_kind() != EVENT_TX:
+            raise RuntimeError("Replay ERROR: recording ended before packet %s" % packet.hex())
+        t, _, recorded = self.events[self.index]
+        self.index += 1
+        if packet != recorded:
+            if self.strict:
+                raise RuntimeError("Replay ERROR: event %d sent %s, recorded %s"
+                                   % (self.index - 1, packet.hex(), recorded.hex()))
+            self.mismatches += 1
+        self.offset = time.perf_counter() - t
+        return len(packet)
+
+    def readPort(self, length):
+        if not self.pending and self.peek_kind() == EVENT_RX:
+            t, _, self.pending = self.events[self.index]
+            self.index += 1
+            if self.realtime:
+                delay = self.offset + t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        data, self.pending = self.pending[:length], self.pending[length:]
+        return data
+
+    def isPacketTimeout(self):
+        if self.pending or self.peek_kind() == EVENT_RX:
+            return False
+        if self.peek_kind() == EVENT_TIMEOUT:
+            t = self.events[self.index][0]
+            self.index += 1
+            if self.realtime:
+                delay = self.offset + t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        # nothing more was recorded for this packet
+        return True
+
+    def getCurrentTime(self):
+        return time.perf_counter() * 1000.0
+
+    def getTimeSinceStart(self):
+        return 0.0
+
+    # recording
+    def peek(self):
+        return self.events[self.index] if self.index < len(self.events) else None
+
+    def peek_kind(self):
+        event = self.peek()
+        return None if event is None else event[1]
+
+    def done(self):
+        """Returns True once every recorded packet has been replayed"""
+        return all(kind != EVENT_TX for _, kind, _ in self.events[self.index:])
+
+
+def save_events(path, events):
+    np.savez(path,
+             time=np.array([t for t, _, _ in events], dtype='<f8'),
+             kind=np.array([kind for _, kind, _ in events], dtype='u1'),
+             length=np.array([len(data) for _, _, data in events], dtype='<u4'),
+             data=np.frombuffer(b''.join(data for _, _, data in events), dtype='u1'))
+
+
+def load_events(path):
+    """Returns the (time, kind, bytes) events saved by CapturePortHandler.save()"""
+    with np.load(path) as f:
+        data = f['data'].tobytes()
+        ends = np.cumsum(f['length'])
+        starts = ends - f['length']
+        return [(float(t), int(kind), data[start:end])
+                for t, kind, start, end in zip(f['time'], f['kind'], starts, ends)]
+
+
+def capture_bus(devicename='/dev/ttyACM0', baudrate=1_000_000, port_handler=None):
+    """Returns a connected DynamixelBus whose port records its traffic, in bus.portHandler"""
+    port_handler = port_handler if port_handler is not None else PortHandler(devicename)
+    bus = DynamixelBus(devicename, baudrate, port_handler=CapturePortHandler(port_handler))
+    bus.connect()
+    return bus
+
+
+def replay_bus(path, strict=True, realtime=True, baudrate=1_000_000):
+    """Returns a connected DynamixelBus that replays the recording saved at `path`"""
+    bus = DynamixelBus(path, baudrate, port_handler=ReplayPortHandler(load_events(path), strict=strict,
+                                                                      realtime=realtime))
+    bus.connect()
+    return bus
+
+
+if __name__ == "__main__":
+    # record deligrasp against the simulated gripper, then time its replay
+    import os, sys, tempfile
+    from magpie.ax12 import Ax12
+    from magpie.dynamixel_sim import SimAx12, SimPortHandler, SpringContact
+    from magpie.gripper import Gripper
+    Ax12.DEBUG = False
+    # a scratch file unless a path is given, so the demo leaves nothing in the working directory
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), 'deligrasp_capture.npz')
+    servos = [SimAx12(1, 303, SpringContact(420, 20.0, 1)), SimAx12(2, 729, SpringContact(610, 20.0, -1))]
+    bus = capture_bus('sim', port_handler=SimPortHandler(servos))
+    start = time.perf_counter()
+    print(Gripper(bus=bus).deligrasp(60.0, 1.0, 2.0, 0.25)[:2])
+    print(f"captured: {time.perf_counter() - start:.3f} s, {len(bus.portHandler.events)} events")
+    bus.portHandler.save(path)
+    bus = replay_bus(path)
+    start = time.perf_counter()
+    print(Gripper(bus=bus).deligrasp(60.0, 1.0, 2.0, 0.25)[:2])
+    print(f"replayed: {time.perf_counter() - start:.3f} s, all packets replayed: {bus.portHandler.done()}")
@@ -0,0 +1,147 @@
+"""
+bus_tuning.py
+Measure servo round-trip latency over the supported baud rates and return delay times, and
+write the fastest configuration that answered every request to the servos' EEPROM.
+EEPROM has limited write cycles, so run this at commissioning time, not per task.
+"""
+
+import time
+
+import numpy as np
+
+from magpie.ax12 import *
+
+# return delay time register values to try, in 2 us units (250 is the factory setting)
+RETURN_DELAYS = (0, 5, 25, 50, 125, 250)
+
+
+def measure_latency(bus, servo, samples=100):
+    """Returns round-trip statistics of `samples` present-position reads of `servo`, times in us.
+    Retries are off while measuring, so every lost status packet counts as a failure."""
+    times = []
+    failures = 0
+    attempts, bus.retry.attempts = bus.retry.attempts, 1
+    try:
+        for _ in range(samples):
+            start = time.perf_counter()
+            try:
+                bus.read(servo.id, ADDR_AX_PRESENT_POSITION_L, 2)
+            except RuntimeError:
+                failures += 1
+                continue
+            times.append(time.perf_counter() - start)
+    finally:
+        bus.retry.attempts = attempts
+    times = np.array(times) * 1e6
+    return {
+        'id': servo.id,
+        'samples': samples,
+        'failures': failures,
+        'mean_us': float(np.mean(times)) if len(times) else float('nan'),
+        'p50_us': float(np.percentile(times, 50)) if len(times) else float('nan'),
+        'p99_us': float(np.percentile(times, 99)) if len(times) else float('nan'),
+        'max_us': float(np.max(times)) if len(times) else float('nan'),
+    }
+
+
+def switch_baudrate(bus, servos, baudrate):
+    """Move `servos` and the port to `baudrate`, returns True if every servo answers there"""
+    for servo in servos:
+        try:
+            servo.set_baudrate(AX12_BAUD_REGISTER[baudrate])
+        except RuntimeError:
+            # the status packet may already come back at the new rate
+            pass
+    bus.set_port_baudrate(baudrate)
+    return all(ping(bus, servo) for servo in servos)
+
+
+def set_return_delays(servos, delays):
+    """Write one return delay time per servo, returns True if every servo answers with it"""
+    for servo, delay in zip(servos, delays):
+        try:
+            servo.set_return_delay_time(delay)
+        except RuntimeError:
+            # the write takes effect even when its status packet is lost
+            pass
+    try:
+        return all(servo.get_return_delay_time() == delay for servo, delay in zip(servos, delays))
+    except RuntimeError:
+        return False
+
+
+def ping(bus, servo):
+    try:
+        bus.read(servo.id, ADDR_AX_ID, 1)
+        return True
+    except RuntimeError:
+        return False
+
+
+def tune_bus_timing(bus, servos, baudrates=(1_000_000, 500_000, 115_200, 57_600),
+                    return_delays=RETURN_DELAYS, samples=100, write=True):
+    """Try every baud rate and return delay time on `servos` and keep the stable one with the lowest
+    mean round trip, or restore the starting configuration if `write` is False.
+    Returns (best row, report rows), where a row describes one configuration and is stable if no
+    read failed. A configuration whose writes fail is reported unstable, and the starting
+    configuration is restored whatever goes wrong during the sweep."""
+    start_baudrate = bus.baudrate
+    start_delays = [servo.get_return_delay_time() for servo in servos]
+    report = []
+    best = None
+    try:
+        for baudrate in baudrates:
+            if baudrate not in AX12_BAUD_REGISTER:
+                continue
+            bus.reset_breakers()
+            if not switch_baudrate(bus, servos, baudrate):
+                report.append({'baudrate': baudrate, 'return_delay': None, 'stable': False,
+                               'mean_us': float('nan'), 'servos': []})
+                bus.reset_breakers()
+                switch_baudrate(bus, servos, start_baudrate)
+                continue
+            for delay in return_delays:
+                # a lossy configuration before opens the circuit breakers, which would fail these writes
+                bus.reset_breakers()
+                try:
+                    if not set_return_delays(servos, [delay] * len(servos)):
+                        raise RuntimeError("Bus tuning ERROR: return delay %d not confirmed" % delay)
+                    rows = [measure_latency(bus, servo, samples) for servo in servos]
+                except RuntimeError as e:
+                    # losing status packets is what the sweep looks for, not a reason to stop it
+                    print("Bus tuning: %d bps, return delay %d failed: %s" % (baudrate, delay, e))
+                    report.append({'baudrate': baudrate, 'return_delay': delay, 'stable': False,
+                                   'mean_us': float('nan'), 'servos': []})
+                    continue
+                report.append({'baudrate': baudrate,
+                               'return_delay': delay,
+                               'stable': all(row['failures'] == 0 for row in rows),
+                               'mean_us': float(np.mean([row['mean_us'] for row in rows])),
+                               'servos': rows})
+        stable = [row for row in report if row['stable']]
+        best = min(stable, key=lambda row: row['mean_us']) if stable else None
+    finally:
+        bus.reset_breakers()
+        if best is not None and write:
+            switch_baudrate(bus, servos, best['baudrate'])
+            set_return_delays(servos, [best['return_delay']] * len(servos))
+        else:
+            switch_baudrate(bus, servos, start_baudrate)
+            set_return_delays(servos, start_delays)
+    return best, report
+
+
+def format_latency_report(report):
+    """Returns the tuning report as a text table, one line per configuration and servo"""
+    lines = ["{:>9} {:>9} {:>4} {:>9} {:>9} {:>9} {:>5}".format(
+        'baud', 'delay_us', 'id', 'mean_us', 'p99_us', 'max_us', 'fails')]
+    for row in report:
+        delay_us = '-' if row['return_delay'] is None else row['return_delay'] * 2
+        if not row['servos']:
+            lines.append("{:>9} {:>9} {:>4} {}".format(row['baudrate'], delay_us, '-',
+                                                      'unreachable' if row['return_delay'] is None else 'failed'))
+        for servo in row['servos']:
+            lines.append("{:>9} {:>9} {:>4} {:>9.1f} {:>9.1f} {:>9.1f} {:>5}".format(
+                row['baudrate'], delay_us, servo['id'], servo['mean_us'], servo['p99_us'],
+                servo['max_us'], servo['failures']))
+    return "\n".join(lines)
@@ -0,0 +1,445 @@
+"""
+dynamixel_sim.py
+Simulated AX-12 servos behind a drop-in replacement for the Dynamixel SDK PortHandler.
+The stock PacketHandler, DynamixelBus, Ax12 and Gripper run against it unchanged, e.g.
+
+    gripper = Gripper(bus=sim_bus())
+
+Instruction packets are parsed and answered byte for byte, status packets arrive after the
+wire time at the port's baud rate plus each servo's return delay time, and servos move toward
+their goal at the configured moving speed until the torque they put out, shaped by the
+compliance margin, slope and punch, is balanced by a contact model.
+
+With a VirtualClock the servos, the wire and a Gripper given the same clock all run on simulated
+time, as fast as the host can compute it.
+"""
+
+import random
+import threading
+import time
+
+import numpy as np
+
+from dynamixel_sdk import *  # Uses Dynamixel SDK library
+
+from magpie.ax12 import *
+
+MAX_SPEED_UNITS = 1023  # a moving speed of 0 means "as fast as possible"
+LOAD_CW_BIT = 1024  # present load direction bit
+
+# control table after a factory reset, keyed by address
+AX12_DEFAULTS = {
+    ADDR_AX_MODEL_NUMBER_L: 12,
+    ADDR_AX_VERSION: 24,
+    ADDR_AX_BAUD_RATE: 1,
+    ADDR_AX_RETURN_DELAY_TIME: 250,
+    ADDR_AX_CCW_ANGLE_LIMIT_L: 0xFF,
+    ADDR_AX_CCW_ANGLE_LIMIT_H: 0x03,
+    ADDR_AX_LIMIT_TEMPERATURE: 70,
+    ADDR_AX_MIN_LIMIT_VOLTAGE: 60,
+    ADDR_AX_MAX_LIMIT_VOLTAGE: 140,
+    ADDR_AX_MAX_TORQUE_L: 0xFF,
+    ADDR_AX_MAX_TORQUE_H: 0x03,
+    ADDR_AX_RETURN_LEVEL: 2,
+    ADDR_AX_ALARM_LED: 36,
+    ADDR_AX_ALARM_SHUTDOWN: 36,
+    ADDR_AX_CW_COMPLIANCE_MARGIN: 1,
+    ADDR_AX_CCW_COMPLIANCE_MARGIN: 1,
+    ADDR_AX_CW_COMPLIANCE_SLOPE: 32,
+    ADDR_AX_CCW_COMPLIANCE_SLOPE: 32,
+    ADDR_AX_TORQUE_LIMIT_L: 0xFF,
+    ADDR_AX_TORQUE_LIMIT_H: 0x03,
+    ADDR_AX_PRESENT_VOLTAGE: 120,
+    ADDR_AX_PRESENT_TEMPERATURE: 35,
+    ADDR_AX_PUNCH_L: 32,
+}
+
+
+class SimClock(WallClock):
+    """ Wall clock used by the simulation, swap for a VirtualClock to run faster than real time. """
+
+
+class VirtualClock:
+    """ Simulated time that only passes when someone sleeps.
+
+    Waiting on the simulated wire and every sleep of a Gripper built with this clock advance it, so
+    a grasp takes the simulated time it would on hardware but only the compute time to run. Sleeps
+    of concurrent threads add up rather than overlap, so use the single-threaded (sweep) paths for
+    timing studies.
+    """
+
+    def __init__(self, start=0.0):
+        self.time = start
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self.lock:
+                self.time += seconds
+
+
+class SpringContact:
+    """ Object surface met by a finger: a linear spring from `position` on in `direction`.
+
+    """
+
+    def __init__(self, position, stiffness, direction=1):
+        """`position` in ticks, `stiffness` in load units per tick, `direction` +1 or -1 of closing"""
+        self.position = position
+        self.stiffness = stiffness
+        self.direction = direction
+
+    def penetration(self, position):
+        return np.maximum(0.0, (position - self.position) * self.direction)
+
+    def load(self, position):
+        """Returns the unsigned load the spring pushes back with at `position`, scalar or array"""
+        return self.stiffness * self.penetration(position)
+
+    def stall_position(self, torque_limit):
+        """Returns the position where the spring load equals `torque_limit`"""
+        return self.position + self.direction * torque_limit / self.stiffness
+
+
+class SimAx12:
+    """ Control table and motion of one simulated AX-12.
+
+    """
+
+    def __init__(self, motor_id, position=512, contact=None, clock=None):
+        self.id = motor_id
+        self.contact = contact
+        self.clock = clock if clock is not None else SimClock()
+        self.power_cycle()
+        self.table[ADDR_AX_ID] = motor_id
+        self.set_word(ADDR_AX_PRESENT_POSITION_L, position)
+        self.set_word(ADDR_AX_GOAL_POSITION_L, position)
+        self.position = float(position)
+
+    def __repr__(self):
+        return "SimAx12('{}')".format(self.id)
+
+    def power_cycle(self):
+        """Reload the RAM registers, EEPROM survives."""
+        eeprom = self.table[:ADDR_AX_TORQUE_ENABLE] if hasattr(self, 'table') else None
+        self.table = bytearray(CONTROL_TABLE_LENGTH)
+        for reg_num, value in AX12_DEFAULTS.items():
+            self.table[reg_num] = value
+        if eeprom is not None:
+            self.table[:ADDR_AX_TORQUE_ENABLE] = eeprom
+            self.set_word(ADDR_AX_TORQUE_LIMIT_L, self.get_word(ADDR_AX_MAX_TORQUE_L))
+            self.set_word(ADDR_AX_PRESENT_POSITION_L, int(round(self.position)))
+            self.set_word(ADDR_AX_GOAL_POSITION_L, int(round(self.position)))
+        # staged REG_WRITE, (reg_num, data) or None
+        self.registered = None
+        self.last_update = self.clock.now()
+
+    def get_word(self, reg_num):
+        return self.table[reg_num] | (self.table[reg_num + 1] << 8)
+
+    def set_word(self, reg_num, value):
+        self.table[reg_num] = value & 0xFF
+        self.table[reg_num + 1] = (value >> 8) & 0xFF
+
+    def baudrate(self):
+        return 2_000_000 / (self.table[ADDR_AX_BAUD_RATE] + 1)
+
+    def return_delay(self):
+        """Returns the return delay time in seconds, the register counts 2 us units"""
+        return self.table[ADDR_AX_RETURN_DELAY_TIME] * 2e-6
+
+    # register access
+    def read(self, reg_num, length):
+        self.update()
+        return bytes(self.table[reg_num:reg_num + length])
+
+    def write(self, reg_num, data):
+        self.update()
+        for i, byte in enumerate(data):
+            if reg_num + i in WRITABLE_REGISTERS:
+                self.table[reg_num + i] = byte
+        if reg_num <= ADDR_AX_GOAL_POSITION_H and ADDR_AX_GOAL_POSITION_L < reg_num + len(data):
+            # a goal position switches the torque on
+            self.table[ADDR_AX_TORQUE_ENABLE] = 1
+
+    def reg_write(self, reg_num, data):
+        self.registered = (reg_num, bytes(data))
+        self.table[ADDR_AX_REGISTERED_INSTRUCTION] = 1
+
+    def action(self):
+        if self.registered is not None:
+            self.write(*self.registered)
+        self.registered = None
+        self.table[ADDR_AX_REGISTERED_INSTRUCTION] = 0
+
+    # motion
+    def torque_limit(self):
+        return min(self.get_word(ADDR_AX_TORQUE_LIMIT_L), self.get_word(ADDR_AX_MAX_TORQUE_L))
+
+    def ticks_per_s(self):
+        speed = self.get_word(ADDR_AX_GOAL_SPEED_L) & 0x3FF
+        return (speed if speed else MAX_SPEED_UNITS) * TICKS_PER_S_PER_SPEED_UNIT
+
+    def output_torque(self, error):
+        """Returns the signed torque (load units) the motor puts out at position error(s) `error`,
+        goal minus position: none within the compliance margin, then rising from the punch to the
+        torque limit over the compliance slope (CW below the goal's position, CCW above)"""
+        error = np.asarray(error, dtype=float)
+        ccw = error > 0
+        margin = np.where(ccw, self.table[ADDR_AX_CCW_COMPLIANCE_MARGIN], self.table[ADDR_AX_CW_COMPLIANCE_MARGIN])
+        slope = np.where(ccw, self.table[ADDR_AX_CCW_COMPLIANCE_SLOPE], self.table[ADDR_AX_CW_COMPLIANCE_SLOPE])
+        limit = self.torque_limit()
+        outside = np.abs(error) - margin
+        torque = np.minimum(np.maximum(limit * outside / np.maximum(slope, 1), self.get_word(ADDR_AX_PUNCH_L)), limit)
+        return np.where(outside > 0, np.sign(error) * torque, 0.0)
+
+    def net_torque(self, positions, goal):
+        """Returns the torque left over at `positions` once the contact load is taken off"""
+        torque = self.output_torque(goal - positions)
+        if self.contact is not None:
+            torque = torque - self.contact.direction * self.contact.load(positions)
+        return torque
+
+    def update(self):
+        """Advance the motor to the present time and refresh the present-state registers."""
+        now = self.clock.now()
+        dt, self.last_update = now - self.last_update, now
+        start = self.position
+        target = float(self.get_word(ADDR_AX_GOAL_POSITION_L))
+        if self.table[ADDR_AX_TORQUE_ENABLE]:
+            target = self.limit_target(target)
+            step = self.ticks_per_s() * dt
+            if abs(target - self.position) <= step:
+                self.position = target
+            else:
+                self.position += step if target > self.position else -step
+        self.position = min(max(self.position, 0.0), 1023.0)
+        self.write_present_state(start, dt)
+
+    def limit_target(self, target):
+        """Returns where the motor comes to rest moving toward `target`: the first tick at which the
+        contact load balances its torque, which may be behind it if the contact pushes it back."""
+        torque = self.net_torque(self.position, target)
+        if torque == 0:
+            return self.position
+        direction = 1 if torque > 0 else -1
+        end = 1023.0 if direction > 0 else 0.0
+        ticks = self.position + direction * np.arange(1, int(abs(end - self.position)) + 1)
+        balanced = np.flatnonzero(direction * self.net_torque(ticks, target) <= 0)
+        if len(balanced) == 0:
+            return end
+        # between the last tick still pushed and the balanced one, the zero crossing of the net torque
+        rest = ticks[balanced[0]]
+        before = rest - direction
+        left, right = self.net_torque(before, target), self.net_torque(rest, target)
+        return float(before + direction * (left / (left - right) if left != right else 1.0))
+
+    def write_present_state(self, start, dt):
+        position = int(round(self.position))
+        self.set_word(ADDR_AX_PRESENT_POSITION_L, position)
+        moved = self.position - start
+        speed = int(min(abs(moved) / dt / TICKS_PER_S_PER_SPEED_UNIT, 1023)) if dt > 0 else 0
+        # bit 10 is the direction, set for CW (decreasing position)
+        self.set_word(ADDR_AX_PRESENT_SPEED_L, speed | (LOAD_CW_BIT if moved < 0 else 0))
+        load = 0
+        if self.contact is not None and self.table[ADDR_AX_TORQUE_ENABLE]:
+            load = int(min(float(self.contact.load(self.position)), 1023))
+            if load and self.contact.direction < 0:
+                load |= LOAD_CW_BIT
+        self.set_word(ADDR_AX_PRESENT_LOAD_L, load)
+        self.table[ADDR_AX_MOVING] = int(speed > 0)
+
+
+class SimPortHandler:
+    """ Stand-in for dynamixel_sdk.PortHandler that answers packets from simulated servos.
+
+    """
+
+    def __init__(self, servos, port_name='sim', clock=None, bulk_read=False):
+        """`servos` are SimAx12, `bulk_read` makes them answer BULK_READ like MX-series servos"""
+        self.servos = {servo.id: servo for servo in servos}
+        self.port_name = port_name
+        self.clock = clock if clock is not None else SimClock()
+        self.bulk_read = bulk_read
+        self.is_open = False
+        self.is_using = False
+        self.baudrate = DEFAULT_BAUDRATE
+        self.tx_time_per_byte = 0.0
+        self.packet_start_time = 0.0
+        self.packet_timeout = 0.0
+        # status bytes on the way back, (arrival time [s], byte)
+        self.rx = []
+        self.tx_packets = 0
+        self.rx_packets = 0
+        # fraction of status packets lost on the wire, the instruction itself still takes effect
+        self.drop_rate = 0.0
+        self.random = random.Random(0)
+
+    # PortHandler interface
+    def openPort(self):
+        return self.setBaudRate(self.baudrate)
+
+    def closePort(self):
+        self.is_open = False
+
+    def clearPort(self):
+        pass
+
+    def setPortName(self, port_name):
+        self.port_name = port_name
+
+    def getPortName(self):
+        return self.port_name
+
+    def setBaudRate(self, baudrate):
+        self.baudrate = baudrate
+        self.tx_time_per_byte = (1000.0 / baudrate) * 10.0
+        self.is_open = True
+        self.rx = []
+        return True
+
+    def getBaudRate(self):
+        return self.baudrate
+
+    def getBytesAvailable(self):
+        now = self.clock.now()
+        return sum(1 for arrival, _ in self.rx if arrival <= now)
+
+    def readPort(self, length):
+        """Wait for up to `length` of the bytes already on their way, like a serial read with timeout."""
+        if not self.rx:
+            return b''
+        count = min(length, len(self.rx))
+        self.clock.sleep(self.rx[count - 1][0] - self.clock.now())
+        data = bytes(byte for _, byte in self.rx[:count])
+        del self.rx[:count]
+        return data
+
+    def writePort(self, packet):
+        packet = bytes(packet)
+        self.tx_packets += 1
+        self.handle(packet, self.clock.now() + len(packet) * self.byte_time())
+        return len(packet)
+
+    def setPacketTimeout(self, packet_length):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = (self.tx_time_per_byte * packet_length) + (LATENCY_TIMER * 2.0) + 2.0
+
+    def setPacketTimeoutMillis(self, msec):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = msec
+
+    def isPacketTimeout(self):
+        if self.rx:
+            return False
+        # nothing more is coming, let the remaining timeout pass
+        self.clock.sleep((self.packet_timeout - self.getTimeSinceStart()) / 1000.0)
+        self.packet_timeout = 0
+        return True
+
+    def getCurrentTime(self):
+        return self.clock.now() * 1000.0
+
+    def getTimeSinceStart(self):
+        return self.getCurrentTime() - self.packet_start_time
+
+    # simulated wire
+    def byte_time(self):
+        return 10.0 / self.baudrate
+
+    def listening(self, servo):
+        """Returns True if `servo` can decode the port's baud rate (within 3%, as the manual allows)"""
+        return abs(servo.baudrate() - self.baudrate) <= 0.03 * self.baudrate
+
+    def send_status(self, servo, start, data=b'', error=0):
+        """Queue a status packet from `servo` that starts after its return delay, returns its end time"""
+        body = bytes([servo.id, len(data) + 2, error]) + bytes(data)
+        packet = b'\xff\xff' + body + bytes([~sum(body) & 0xFF])
+        start = max(start + servo.return_delay(), self.rx[-1][0] if self.rx else start)
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            return start + len(packet) * self.byte_time()
+        for i, byte in enumerate(packet):
+            self.rx.append((start + (i + 1) * self.byte_time(), byte))
+        self.rx_packets += 1
+        return start + len(packet) * self.byte_time()
+
+    def handle(self, packet, end):
+        """Act on one instruction packet that finished arriving at time `end`"""
+        dxl_id, instruction = packet[2], packet[4]
+        params = packet[5:-1]
+        if sum(packet[2:-1]) & 0xFF != (~packet[-1]) & 0xFF:
+            error = ERRBIT_CHECKSUM
+        else:
+            error = 0
+        if dxl_id == BROADCAST_ID:
+            targets = list(self.servos.values())
+        else:
+            targets = [self.servos[dxl_id]] if dxl_id in self.servos else []
+        targets = [servo for servo in targets if self.listening(servo)]
+
+        if instruction == INST_SYNC_WRITE and not error:
+            reg_num, data_length = params[0], params[1]
+            for i in range(2, len(params), data_length + 1):
+                servo = self.servos.get(params[i])
+                if servo is not None and self.listening(servo):
+                    servo.write(reg_num, params[i + 1:i + 1 + data_length])
+            return
+        if instruction == INST_BULK_READ and not error:
+            if self.bulk_read:
+                for i in range(1, len(params), 3):
+                    servo = self.servos.get(params[i + 1])
+                    if servo is not None and self.listening(servo):
+                        end = self.send_status(servo, end, servo.read(params[i + 2], params[i]))
+            return
+
+        for servo in targets:
+            data = b''
+            if error:
+                pass
+            elif instruction == INST_READ:
+                data = servo.read(params[0], params[1])
+            elif instruction == INST_WRITE:
+                servo.write(params[0], params[1:])
+            elif instruction == INST_REG_WRITE:
+                servo.reg_write(params[0], params[1:])
+            elif instruction == INST_ACTION:
+                servo.action()
+            elif instruction != INST_PING:
+                error = ERRBIT_INSTRUCTION
+            # status return level 0 answers only PING, 1 answers PING and READ
+            level = servo.table[ADDR_AX_RETURN_LEVEL]
+            answers = level >= 2 or instruction == INST_PING or (level == 1 and instruction == INST_READ)
+            if dxl_id != BROADCAST_ID and answers:
+                self.send_status(servo, end, data, error)
+
+
+def sim_bus(ids=(1, 2), positions=None, contacts=None, clock=None, baudrate=1_000_000, bulk_read=False):
+    """Returns a connected DynamixelBus with one simulated AX-12 per id.
+    `positions` and `contacts` are optional {id: ticks} and {id: SpringContact}."""
+    clock = clock if clock is not None else SimClock()
+    positions = positions or {}
+    contacts = contacts or {}
+    servos = [SimAx12(dxl_id, positions.get(dxl_id, 512), contacts.get(dxl_id), clock) for dxl_id in ids]
+    bus = DynamixelBus('sim', baudrate, port_handler=SimPortHandler(servos, clock=clock, bulk_read=bulk_read))
+    bus.connect()
+    return bus
+
+
+if __name__ == "__main__":
+    # cycle time of the grasp routines against the simulated gripper
+    from magpie.gripper import Gripper
+    Ax12.DEBUG = False
+    contacts = {1: SpringContact(420, 20.0, 1), 2: SpringContact(610, 20.0, -1)}
+    gripper = Gripper(bus=sim_bus(positions={1: 303, 2: 729}, contacts=contacts))
+    gripper.open_gripper()
+    for name, routine in [
+            ('set_goal_aperture_record_load', lambda: gripper.set_goal_aperture_record_load(40.0, debug=False)),
+            ('deligrasp', lambda: gripper.deligrasp(60.0, 1.0, 2.0, 0.25)),
+            ('poke', lambda: gripper.poke('left', 0.05, 30.0))]:
+        gripper.reset_parameters()
+        start = time.perf_counter()
+        routine()
+        print(f"{name}: {time.perf_counter() - start:.3f} s")
@@ -0,0 +1,144 @@
+"""
+force_control.py
+Closed-loop grip force: a fixed-rate PI loop that moves each finger's goal position until the
+servo load matches a commanded contact force.
+
+The AX-12 has no force sensing besides present load, and its output torque grows with the
+distance between goal and present position (compliance slope), so pushing the goal further into
+the object presses harder. The loop reads both fingers' present state each cycle, sends both goals
+in one SyncWrite, and keeps its cycle start times on a fixed grid of the gripper's clock.
+"""
+
+import numpy as np
+
+from magpie.ax12 import load_magnitude
+
+
+class ForceController:
+    """ PI control of the contact force of one or both fingers at `rate_hz`.
+
+    Gains act on the load error in load units (0-1023) and give goal offsets in ticks, `ki` per
+    second; the load is used rather than Newtons because load_to_N is steep between loads 100 and
+    150, which would make the loop gain depend on the force. `max_travel` caps how far (ticks) a
+    goal may go past where the finger started, reaching it means nothing is between the fingers.
+    """
+
+    def __init__(self, gripper, rate_hz=100.0, kp=0.03, ki=3.0, tolerance=0.05, settle_cycles=5,
+                 max_travel=100, loss_fraction=0.25, loss_cycles=3, speed=300, debug=False):
+        self.gripper = gripper
+        self.bus = gripper.bus
+        self.clock = gripper.clock
+        self.period = 1.0 / rate_hz
+        self.kp = kp
+        self.ki = ki
+        # settled once every finger is within tolerance (fraction of the target load) for settle_cycles
+        self.tolerance = tolerance
+        self.settle_cycles = settle_cycles
+        self.max_travel = max_travel
+        # a finger that had contact is lost when its load stays below loss_fraction of the target
+        self.loss_fraction = loss_fraction
+        self.loss_cycles = loss_cycles
+        self.speed = speed
+        self.debug = debug
+        self.running = False
+
+    def stop(self):
+        """End run() at its next cycle, e.g. from another thread"""
+        self.running = False
+
+    def run(self, force, finger='both', duration=2.0, until_settled=True):
+        '''
+        hold `force` (N, per finger) until settled, `duration` seconds pass, stop() or object loss
+        @return: report dict with status ('settled', 'timeout', 'stopped' or 'lost'), the final
+                 force (N) and position of each finger, cycle count, overruns and jitter
+        '''
+        names = ['left', 'right'] if finger=='both' else [finger]
+        servos = [self.gripper.Finger1 if name=='left' else self.gripper.Finger2 for name in names]
+        # the left finger closes with rising positions, the right one with falling positions
+        direction = np.array([1 if name=='left' else -1 for name in names])
+        target = self.gripper.N_to_load(force)
+        states = self.bus.read_states(servos)
+        start_pos = np.array([s.position for s in states], dtype=float)
+        low = np.array([self.position_limit(name, 'min') for name in names])
+        high = np.array([self.position_limit(name, 'max') for name in names])
+        # the goal offset must reach the full torque limit, so the limit caps the force instead
+        torque = int(min(1023, max(self.gripper.force_to_load(2.0 * force, finger=names[0]), target + 50)))
+        self.bus.sync_set_goal_position(servos, [int(p) for p in start_pos], [self.speed] * len(servos),
+                                        [torque] * len(servos))
+        integral = np.zeros(len(servos))
+        contact = np.zeros(len(servos), dtype=bool)
+        low_load = np.zeros(len(servos), dtype=int)
+        in_tolerance = 0
+        jitter = []
+        overruns = 0
+        cycles = 0
+        status = 'timeout'
+        self.running = True
+        start = self.clock.now()
+        next_time = start
+        while self.running:
+            load = np.array([load_magnitude(s.load) for s in states], dtype=float)
+            position = np.array([s.position for s in states], dtype=float)
+            error = target - load
+            contact |= load >= 0.5 * target
+            low_load = np.where(contact & (load < self.loss_fraction * target), low_load + 1, 0)
+            in_tolerance = in_tolerance + 1 if np.all(np.abs(error) <= self.tolerance * target) else 0
+            if self.debug:
+                print(f"load: {load}, position: {position}, error: {error}")
+            if np.any(low_load >= self.loss_cycles):
+                status = 'lost'
+                break
+            if until_settled and in_tolerance >= self.settle_cycles:
+                status = 'settled'
+                break
+            if self.clock.now() - start >= duration:
+                break
+            # PI step, the integral is clamped to the travel so it cannot wind up against the stops
+            integral = np.clip(integral + self.ki * error * self.period, -self.max_travel, self.max_travel)
+            offset = np.clip(self.kp * error + integral, -self.max_travel, self.max_travel)
+            if np.any((offset >= self.max_travel) & ~contact):
+                status = 'lost'
+                break
+            goal = np.clip(np.round(start_pos + direction * offset), low, high).astype(int)
+            self.bus.sync_set_goal_position(servos, list(goal))
+            cycles += 1
+            # fixed grid of cycle start times, a late cycle does not push back the ones after it
+            next_time += self.period
+            now = self.clock.now()
+            if now > next_time:
+                overruns += 1
+                next_time += np.ceil((now - next_time) / self.period) * self.period
+            self.clock.sleep(next_time - self.clock.now())
+            jitter.append(self.clock.now() - next_time)
+            states = self.bus.read_states(servos)
+        else:
+            status = 'stopped'
+        self.running = False
+        if status == 'lost':
+            # hold still where the fingers are instead of chasing the force into empty space
+            self.bus.sync_set_goal_position(servos, [s.position for s in states])
+        # back to the speed the gripper's wait estimates assume, the torque limit keeps capping the force
+        self.gripper.set_speed(self.gripper.speed, finger=finger)
+        jitter = np.abs(np.array(jitter)) * 1e6
+        return {
+            'status': status,
+            'force': [self.gripper.load_to_N(load_magnitude(s.load)) for s in states],
+            'position': [s.position for s in states],
+            'time': self.clock.now() - start,
+            'cycles': cycles,
+            'overruns': overruns,
+            'jitter_mean_us': float(np.mean(jitter)) if len(jitter) else 0.0,
+            'jitter_max_us': float(np.max(jitter)) if len(jitter) else 0.0,
+        }
+
+    def position_limit(self, name, end):
+        # servo positions of the theta limits of a finger
+        theta = getattr(self.gripper, 'Finger{}theta_{}'.format(1 if name=='left' else 2, end))
+        return int(theta * 1023 / 300)
+
+
+def format_force_report(report):
+    """Returns the report of ForceController.run() as one line"""
+    return ("{status}: {cycles} cycles in {time:.3f} s, force {force} N, overruns {overruns}, "
+            "jitter mean {jitter_mean_us:.0f} us max {jitter_max_us:.0f} us").format(
+                **dict(report, force=[round(f, 2) for f in report['force']]))
@@ -0,0 +1,151 @@
+"""
+grasp_log.py
+Structured records of deligrasp iterations, an append-only store of them on disk, and vectorized
+post-processing over many grasps.
+
+    gripper.start_grasp_log('grasps.tlog', session=3)
+    gripper.deligrasp(60.0, 1.0, 2.0, 0.25, object_id=12)
+    rows = read_grasp_log('grasps.tlog')
+    stiffness_fit(select(rows, object_id=12))
+
+The store is a TelemetryRecorder file of GRASP_RECORD rows, so reading it back maps the file
+instead of loading it, and every function below works on the mapped columns without Python loops
+over rows. Rows of one grasp are appended together, so each grasp is a contiguous run of rows.
+"""
+
+import numpy as np
+
+from magpie.telemetry import TelemetryRecorder, read_telemetry_log
+
+# one row per deligrasp step; step 0 is the first attempt at the initial aperture, time is seconds
+# since the grasp started on the gripper's clock, forces are per finger in N
+GRASP_RECORD = np.dtype([('session', '<u4'), ('object', '<u4'), ('grasp', '<u4'), ('step', '<u2'),
+                         ('time', '<f8'), ('goal_aperture', '<f8'), ('aperture', '<f8'),
+                         ('applied_force', '<f8'), ('force_left', '<f8'), ('force_right', '<f8'),
+                         ('max_left', '<f8'), ('max_right', '<f8'), ('slip', '?'), ('k', '<f8')])
+# contiguous run of rows of one grasp, see grasp_index()
+GRASP_INDEX = np.dtype([('session', '<u4'), ('object', '<u4'), ('grasp', '<u4'), ('start', '<i8'), ('count', '<i8')])
+
+
+class GraspLogStore(TelemetryRecorder):
+    """ Append-only memory-mapped file of GRASP_RECORD rows. """
+
+    def __init__(self, path, capacity=1 << 16):
+        super().__init__(path, capacity=capacity, dtype=GRASP_RECORD)
+
+    def next_grasp(self, session):
+        """Returns the next free grasp number of `session`"""
+        with self.lock:
+            rows = self.records[:self.count]
+            same = rows['grasp'][rows['session'] == session]
+            return int(same.max()) + 1 if len(same) else 0
+
+
+def read_grasp_log(path):
+    """Returns the rows of a grasp log as a read-only structured array mapped from the file"""
+    return read_telemetry_log(path)
+
+
+def step_stiffness(rows):
+    """Returns the k of every step as deligrasp reports it: the mean contact force times the
+    aperture change from the step before (mm), times 1000; 0 for the first step of each grasp"""
+    force = (rows['force_left'] + rows['force_right']) / 2.0
+    distance = np.abs(np.diff(rows['aperture'], prepend=rows['aperture'][:1]))
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows['grasp'][1:] != rows['grasp'][:-1]) | (rows['session'][1:] != rows['session'][:-1])
+    return np.where(first, 0.0, force * distance * 1000.0)
+
+
+def select(rows, session=None, object_id=None, grasp=None):
+    """Returns the rows of one session, object and/or grasp, a copy of just those rows"""
+    mask = np.ones(len(rows), dtype=bool)
+    if session is not None:
+        mask &= rows['session'] == session
+    if object_id is not None:
+        mask &= rows['object'] == object_id
+    if grasp is not None:
+        mask &= rows['grasp'] == grasp
+    return rows[mask]
+
+
+def grasp_index(rows):
+    """Returns one row per grasp: session, object, grasp, first row and row count"""
+    if len(rows) == 0:
+        return np.zeros(0, dtype=GRASP_INDEX)
+    start = np.flatnonzero(np.concatenate(([True], (rows['grasp'][1:] != rows['grasp'][:-1]) |
+                                                   (rows['session'][1:] != rows['session'][:-1]))))
+    index = np.zeros(len(start), dtype=GRASP_INDEX)
+    index['session'] = rows['session'][start]
+    index['object'] = rows['object'][start]
+    index['grasp'] = rows['grasp'][start]
+    index['start'] = start
+    index['count'] = np.diff(np.append(start, len(rows)))
+    return index
+
+
+def group_sums(index, values):
+    # sum of `values` over the rows of each grasp in `index`
+    return np.add.reduceat(values, index['start']) if len(index) else np.zeros(0)
+
+
+def stiffness_fit(rows, min_force=0.15):
+    """Least-squares slope of contact force against aperture per grasp, as stiffness in N/mm.
+    Only steps in contact (mean force above min_force, the gripper's sensing floor) are fitted.
+    Returns one row per grasp with steps in contact: session, object, grasp, k, the number of
+    points and the r^2 of the fit; k is nan where fewer than two points differ in aperture."""
+    rows = rows[(rows['force_left'] + rows['force_right']) / 2.0 > min_force]
+    index = grasp_index(rows)
+    x = rows['aperture']
+    y = (rows['force_left'] + rows['force_right']) / 2.0
+    n = index['count'].astype(float)
+    sx, sy = group_sums(index, x), group_sums(index, y)
+    sxx, sxy, syy = group_sums(index, x * x), group_sums(index, x * y), group_sums(index, y * y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        cov = sxy - sx * sy / n
+        slope = np.where(var_x > 1e-12, cov / var_x, np.nan)
+        r2 = np.where((var_x > 1e-12) & (var_y > 1e-12), cov * cov / (var_x * var_y), np.nan)
+    fit = np.zeros(len(index), dtype=[('session', '<u4'), ('object', '<u4'), ('grasp', '<u4'),
+                                      ('k', '<f8'), ('points', '<i8'), ('r2', '<f8')])
+    fit['session'], fit['object'], fit['grasp'] = index['session'], index['object'], index['grasp']
+    # closing the fingers lowers the aperture and raises the force, so the stiffness is -slope
+    fit['k'] = -slope
+    fit['points'] = index['count']
+    fit['r2'] = r2
+    return fit
+
+
+def force_aperture_curve(rows, bins=20, by='object'):
+    """Mean contact force over aperture bins, per value of the `by` column (e.g. 'object').
+    Returns (keys, bin edges in mm, mean force [key, bin] with nan for empty bins)."""
+    keys, group = np.unique(rows[by], return_inverse=True)
+    edges = np.histogram_bin_edges(rows['aperture'], bins=bins)
+    column = np.clip(np.searchsorted(edges, rows['aperture'], side='right') - 1, 0, len(edges) - 2)
+    cell = group * (len(edges) - 1) + column
+    size = len(keys) * (len(edges) - 1)
+    force = (rows['force_left'] + rows['force_right']) / 2.0
+    total = np.bincount(cell, weights=force, minlength=size)
+    count = np.bincount(cell, minlength=size)
+    with np.errstate(invalid='ignore'):
+        mean = (total / count).reshape(len(keys), len(edges) - 1)
+    return keys, edges, mean
+
+
+def slip_stats(rows):
+    """Per object: grasps, mean steps per grasp, fraction of steps that slipped, fraction of grasps
+    that ended without slip, and the mean applied force at the last step"""
+    index = grasp_index(rows)
+    last = index['start'] + index['count'] - 1
+    objects, group = np.unique(index['object'], return_inverse=True)
+    grasps = np.bincount(group)
+    stats = np.zeros(len(objects), dtype=[('object', '<u4'), ('grasps', '<i8'), ('steps', '<f8'),
+                                          ('slip_rate', '<f8'), ('success_rate', '<f8'), ('final_force', '<f8')])
+    stats['object'] = objects
+    stats['grasps'] = grasps
+    stats['steps'] = np.bincount(group, weights=index['count']) / grasps
+    stats['slip_rate'] = np.bincount(group, weights=group_sums(index, rows['slip'].astype(float))) / \
+        np.bincount(group, weights=index['count'])
+    stats['success_rate'] = np.bincount(group, weights=~rows['slip'][last] * 1.0) / grasps
+    stats['final_force'] = np.bincount(group, weights=rows['applied_force'][last]) / grasps
+    return stats
@@ -1,31 +1,90 @@
 import sys
 sys.path.append("../../")
-from magpie.ax12 import Ax12
-import math
+from magpie.ax12 import Ax12, DynamixelBus, WallClock, TICKS_PER_S_PER_SPEED_UNIT, ADDR_AX_GOAL_POSITION_L, ADDR_AX_GOAL_SPEED_L, load_magnitude
+from magpie.bus_tuning import tune_bus_timing, format_latency_report
+from magpie.telemetry import TelemetryPoller, TelemetryRecorder
+from magpie.kinematics import FingerKinematics
+from magpie.force_control import ForceController, format_force_report
+from magpie.grasp_log import GRASP_RECORD, GraspLogStore, step_stiffness
+from magpie.profiles import DEFAULT_PROFILES, profile_registers, load_profiles, format_profile_report
 import spatialmath as sm
 import copy
-import time
 import numpy as np
 from multiprocessing import Process
 import threading
 import itertools
 
+def load_poly_N(load):
+    '''
+    contact force (N) of raw present loads by Stephen Otto's fit, element-wise over arrays
+    '''
+    load = load_magnitude(np.asarray(load))
+    return np.where(load < 100,
+                    0.0025 * load - 0.0000007 * load**2,
+                    -0.00001889 * load**2 + 0.038399 * load - 3.4073)
+
+# contact force (N) of every raw present load 0-2047, 1024 and up being the CCW encoding
+LOAD_TO_N_TABLE = load_poly_N(np.arange(2048))
+# force of load magnitudes 0-1023, made non-decreasing (the fit peaks near 1016) for the inverse search
+LOAD_N_MONOTONE = np.maximum.accumulate(LOAD_TO_N_TABLE[:1024])
+
+class ContactForceMonitor:
+    """ Running contact-force criterion of one grasp attempt, fed one load sample at a time.
+
+    Keeps the count, sum and maximum of the load magnitude of each finger, and whether it went
+    over stop_load, so the criterion of Gripper.check_slip is known after every sample instead
+    of being recomputed over the whole trace when the sweep is done.
+    """
+
+    def __init__(self, stop_load, fingers=2):
+        self.stop_load = stop_load
+        self.count = [0] * fingers
+        self.total = [0] * fingers
+        self.max = [0] * fingers
+        self.reached = [False] * fingers
+
+    def add(self, i, load):
+        '''
+        @param i: finger index, in the order of the position-load data
+        @param load: raw present load
+        @return: True once every finger went over stop_load
+        '''
+        # drop the direction bit the same way check_slip does
+        load = load_magnitude(load)
+        self.count[i] += 1
+        self.total[i] += load
+        if load > self.max[i]:
+            self.max[i] = load
+        if load > self.stop_load:
+            self.reached[i] = True
+        return self.met()
+
+    def met(self):
+        return all(self.reached)
+
+    def mean(self, i):
+        return self.total[i] / self.count[i] if self.count[i] else 0.0
+
 class Gripper:
     
-    def __init__(self, servoport = '/dev/ttyACM0'):
+    def __init__(self, servoport = '/dev/ttyACM0', bus = None, clock = None):
         # e.g 'COM3' windows or '/dev/ttyUSB0' for Linux, '/dev/ttyACM0'
-        # sets baudrate and opens com port
-        # Ax12.DEVICENAME = '/dev/cu.usbmodem141401'
-        Ax12.DEVICENAME = servoport
-        Ax12.BAUDRATE = 1_000_000
-        # sets baudrate and opens com port
-        Ax12.connect()
+        # each gripper owns its bus, so grippers on separate ports can run side by side
+        if bus is None:
+            bus = DynamixelBus(servoport, 1_000_000)
+            # sets baudrate and opens com port
+            bus.connect()
+        self.bus = bus
+        # every wait of the grasp routines goes through the clock, a simulated port brings its own
+        if clock is None:
+            clock = getattr(bus.portHandler, 'clock', None) or WallClock()
+        self.clock = clock
         # create AX12 instance with ID 1 and 2
         #Motor ID1 should be on the right with the camera facing you
         finger_id1 = 1 # left gripper
         finger_id2 = 2
-        self.Finger1 = Ax12(finger_id1)
-        self.Finger2 = Ax12(finger_id2)
+        self.Finger1 = Ax12(finger_id1, self.bus)
+        self.Finger2 = Ax12(finger_id2, self.bus)
         #speed is in bits from 0-1023 for CCW; 1024 -2047 CW
         # ax-12 manual says no-load moving speed is 59 RPM @ 12V
         self.speed = 100 # about 10% speed, or 11rpm
@@ -47,6 +106,21 @@ class Gripper:
         '''
         self.delay = 0.0055
         self.latency = 0.0006
+        # sweep instead of stepping one tick at a time in the load-recording and contact loops,
+        # at sweep_speed (self.speed if None)
+        self.sweep = False
+        self.sweep_speed = None
+        # ForceController of the running hold_force(), its stop() ends the loop from another thread
+        self.force_controller = None
+        # background state sampling, see start_telemetry()
+        self.telemetry = None
+        self.telemetry_max_age = None
+        # memory-mapped log of every state read, see start_recording()
+        self.recorder = None
+        # store of deligrasp steps, see start_grasp_log(); rows are tagged with session and grasp number
+        self.grasp_store = None
+        self.grasp_session = 0
+        self.grasp_count = 0
 
         self.Finger1.set_torque_limit(self.torque)
         self.Finger2.set_torque_limit(self.torque)
@@ -66,6 +140,10 @@ class Gripper:
                 'compliance_margin': 1,
                 'compliance_slope': 32,
             }
+        # named parameter sets for use_profile(), 'default' is default_parameters
+        self.profiles = copy.deepcopy(DEFAULT_PROFILES)
+        self.profiles['default'].update(self.default_parameters)
+        self.profile = None
 
         #dont touch
         self.Crank = 45 # crank length
@@ -84,6 +162,7 @@ class Gripper:
         self.offset_servo_y  = -21 # difference between camera y-pos and servo y-pos
         self.offset_finger_x = -24.32 # difference between crank x-pos and finger base x-pos
         self.offset_finger_y = 1.32 # difference between crank y-pos and finger base y-pos
+        self.build_kinematics()
 
     #this is before you attach your motors to the gripper
     def setup(self):
@@ -91,35 +170,187 @@ class Gripper:
         self.Finger2.set_goal_position(1023)
 
     def reset_parameters(self):
-        self.apply_to_fingers('set_torque_limit', self.default_parameters['torque'], finger='both', noarg=False)
-        self.apply_to_fingers('set_moving_speed', self.default_parameters['speed'], finger='both', noarg=False)
-        self.apply_to_fingers('set_cw_compliance_margin', self.default_parameters['compliance_margin'], finger='both', noarg=False)
-        self.apply_to_fingers('set_ccw_compliance_margin', self.default_parameters['compliance_margin'], finger='both', noarg=False)
-        self.apply_to_fingers('set_cw_compliance_slope', self.default_parameters['compliance_slope'], finger='both', noarg=False)
-        self.apply_to_fingers('set_ccw_compliance_slope', self.default_parameters['compliance_slope'], finger='both', noarg=False)
+        self.use_profile('default')
         self.open_gripper()
-        time.sleep(0.0025)
+        self.clock.sleep(0.0025)
+
+    def load_profiles(self, path):
+        # add or replace profiles from a JSON file, see magpie.profiles
+        self.profiles.update(load_profiles(path, default=self.profiles['default']))
+
+    def use_profile(self, name, finger='both', debug=False):
+        '''
+        switch to the named parameter profile (torque, speed, compliance margin and slope, punch)
+        @return: report with the number of registers changed, SyncWrites sent and the switch latency (ms)
+        '''
+        report = self.apply_parameters(self.profiles[name], finger=finger)
+        report['name'] = name
+        self.profile = name
+        # the sweeps and wait estimates follow the profile's moving speed
+        self.speed = self.profiles[name]['speed']
+        if debug:
+            print(format_profile_report(report))
+        return report
 
-    def open_gripper(self):
+    def apply_parameters(self, parameters, finger='both'):
+        '''
+        write the profile parameters in `parameters`, only those that differ from the servos' register shadows;
+        both fingers share one SyncWrite per run of neighbouring registers
+        '''
+        servos = [self.Finger1, self.Finger2] if finger=='both' else [self.Finger1 if finger=='left' else self.Finger2]
+        registers = profile_registers(parameters)
+        start = self.clock.now()
+        changed = sum(servo.shadow[reg] != byte for servo in servos for reg, byte in registers.items())
+        packets = self.bus.sync_write_changes(servos, [registers] * len(servos))
+        latency = self.clock.now() - start
+        return {'name': None, 'registers': changed, 'packets': packets, 'latency_ms': latency * 1000.0}
+
+    def open_gripper(self, settle=True, timeout=None):
+        # settle: return once both fingers stop (within timeout), otherwise after 100ms
         open1 = int((self.Finger1theta_min+4)*1023/300)
         open2 = int((self.Finger2theta_max-4)*1023/300)
-        self.Finger1.set_goal_position(open1)
-        self.Finger2.set_goal_position(open2)
-        time.sleep(0.1) # 100ms
+        self.set_goal_position_both(open1, open2)
+        if settle:
+            self.wait_until_settled(finger='both', timeout=timeout)
+        else:
+            self.clock.sleep(0.1) # 100ms
 
-    def close_gripper(self):
+    def close_gripper(self, settle=True, timeout=None):
         close1 = int((self.Finger1theta_max-4)*1023/300)
         close2 = int((self.Finger2theta_min+4)*1023/300)
-        self.Finger1.set_goal_position(close1)
-        self.Finger2.set_goal_position(close2)
-        time.sleep(0.1) # 100ms
+        self.set_goal_position_both(close1, close2)
+        if settle:
+            self.wait_until_settled(finger='both', timeout=timeout)
+        else:
+            self.clock.sleep(0.1) # 100ms
+
+    def wait_until_settled(self, finger='both', timeout=None, tolerance=2, stall_ticks=3, debug=False):
+        '''
+        poll the fingers until every one has stopped: MOVING cleared, within tolerance of its goal, or
+        held in place (e.g. by an object) for as long as moving stall_ticks ticks takes at its moving speed
+        @param timeout: seconds to wait at most, by default the fat-buffer estimate of set_goal_aperture
+        @param tolerance: ticks from the goal position that count as arrived
+        @return: True if the fingers settled, False on timeout
+        '''
+        servos = [self.Finger1, self.Finger2] if finger=='both' else [self.Finger1 if finger=='left' else self.Finger2]
+        goals = [servo.get_cached_register2(ADDR_AX_GOAL_POSITION_L) for servo in servos]
+        # a slow finger reads the same tick for several polls while still moving, so the stall window
+        # is the time of stall_ticks ticks at the commanded speed (0 is the servo's full speed)
+        speeds = [servo.get_cached_register2(ADDR_AX_GOAL_SPEED_L) or 1023 for servo in servos]
+        stall_s = [stall_ticks / (speed * TICKS_PER_S_PER_SPEED_UNIT) for speed in speeds]
+        start = self.clock.now()
+        last = [None] * len(servos)
+        last_move = [start] * len(servos)
+        while True:
+            settled = True
+            now = self.clock.now()
+            for i, servo in enumerate(servos):
+                position, moving = servo.read_motion()
+                if position != last[i]:
+                    last[i] = position
+                    last_move[i] = now
+                if moving and abs(position - goals[i]) > tolerance and now - last_move[i] <= stall_s[i]:
+                    settled = False
+            elapsed = self.clock.now() - start
+            if timeout is None:
+                # first poll: allow the time the slowest finger needs to reach its goal
+                timeout = max(abs(position - goal) * max(self.delay, 1.0 / (speed * TICKS_PER_S_PER_SPEED_UNIT))
+                              for position, goal, speed in zip(last, goals, speeds)) * 2.0 + max(stall_s) + self.delay
+            if settled or elapsed >= timeout:
+                break
+            self.clock.sleep(self.delay)
+        if debug:
+            print(f"settled: {settled}, positions: {last}, wait_time: {elapsed}")
+        return settled
 
     def reset_packet_overload(self, finger='both'):
+        # an overload alarm clears torque enable and torque limit behind the register shadow's back
+        self.invalidate_parameters()
         self.Finger1.set_torque_enable(True)
         self.Finger2.set_torque_enable(True)
         self.Finger1.set_torque_limit(self.default_parameters['torque'])
         self.Finger2.set_torque_limit(self.default_parameters['torque'])
 
+    def tune_timing(self, samples=100, write=True):
+        # measure round trips over baud rates and return delays, keep the fastest stable setting
+        # and derive delay and latency from the measurement instead of the hand-tuned defaults
+        best, report = tune_bus_timing(self.bus, [self.Finger1, self.Finger2], samples=samples, write=write)
+        print(format_latency_report(report))
+        if best is not None and write:
+            self.latency = best['mean_us'] * 1e-6
+            # one tick at self.speed plus a round trip, with the ~10% buffer of the defaults
+            self.delay = (1.0 / (self.speed * TICKS_PER_S_PER_SPEED_UNIT) + self.latency) * 1.1
+        return best, report
+
+    def start_telemetry(self, rate_hz=50.0, max_age=None):
+        '''
+        sample both fingers in the background so getters return the latest sample without a bus read
+        @param rate_hz: sampling rate
+        @param max_age: oldest sample (s) getters accept before reading the bus, default two periods
+        '''
+        if self.telemetry is None:
+            self.telemetry = TelemetryPoller(self.bus, [self.Finger1, self.Finger2], rate_hz=rate_hz,
+                                             recorder=self.recorder)
+        self.telemetry_max_age = max_age if max_age is not None else 2.0 / rate_hz
+        self.telemetry.start()
+        return self.telemetry
+
+    def stop_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+
+    def start_recording(self, path, capacity=1 << 20):
+        '''
+        append every state read from the bus, by telemetry or the grasp loops, to the log at path
+        read it back with magpie.telemetry.read_telemetry_log(path)
+        '''
+        self.stop_recording()
+        self.recorder = TelemetryRecorder(path, capacity=capacity)
+        if self.telemetry is not None:
+            self.telemetry.recorder = self.recorder
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            if self.telemetry is not None:
+                self.telemetry.recorder = None
+            self.recorder.close()
+            self.recorder = None
+
+    def start_grasp_log(self, path, session=0, capacity=1 << 16):
+        '''
+        append the steps of every deligrasp to the grasp log at path, tagged with session
+        read it back with magpie.grasp_log.read_grasp_log(path)
+        '''
+        self.stop_grasp_log()
+        self.grasp_store = GraspLogStore(path, capacity=capacity)
+        self.grasp_session = session
+        self.grasp_count = self.grasp_store.next_grasp(session)
+        return self.grasp_store
+
+    def stop_grasp_log(self):
+        if self.grasp_store is not None:
+            self.grasp_store.close()
+            self.grasp_store = None
+
+    def get_sample_age(self):
+        '''
+        @return age (s) of the state getters return, 0 when they read the bus
+        '''
+        if self.telemetry is None:
+            return 0.0
+        age = self.telemetry.age()
+        return age if age <= self.telemetry_max_age else 0.0
+
+    def invalidate_parameters(self, finger='both'):
+        # forget cached register values, e.g. after a power cycle or a servo error
+        self.apply_to_fingers('invalidate_shadow', None, finger=finger, noarg=True)
+
+    def resync_parameters(self, finger='both'):
+        # reload cached register values from the servos
+        self.apply_to_fingers('resync_shadow', None, finger=finger, noarg=True)
+
     def theta_limit(self, delta_theta):
         Motor1_theta = -delta_theta + self.Motor1theta_90
         Motor2_theta = delta_theta + self.Motor2theta_90
@@ -129,6 +360,56 @@ class Gripper:
             return 1
         return 0
 
+    def build_kinematics(self):
+        '''
+        tabulate theta, aperture and fingertip z of each finger over servo positions 0-1023
+        call again after changing the finger geometry or theta limits above
+        '''
+        self.kinematics = {
+            'left': FingerKinematics(-1, self.Finger1theta_90, self.Finger1theta_min, self.Finger1theta_max,
+                                     self.crank_length, self.offset_finger_x, self.offset_servo_x,
+                                     self.finger_length, self.offset_finger_y, self.offset_servo_y),
+            'right': FingerKinematics(1, self.Finger2theta_90, self.Finger2theta_min, self.Finger2theta_max,
+                                      self.crank_length, self.offset_finger_x, self.offset_servo_x,
+                                      self.finger_length, self.offset_finger_y, self.offset_servo_y),
+        }
+
+    # only for left or right finger, not both
+    def aperture_to_position(self, aperture, finger='left', debug=False):
+        '''
+        table lookup of theta_to_position(aperture_to_theta(aperture)), same result
+        @param aperture: x-distance (mm) from the finger to the camera center, scalar or array
+        '''
+        pos = self.kinematics[finger].position(aperture)
+        if debug:
+            print(f'position: {pos}')
+        return pos
+
+    # only for left or right finger, not both
+    def position_to_aperture(self, position, finger='left'):
+        # table lookup of theta_to_aperture(position_to_theta(position)), scalar or array
+        return self.kinematics[finger].aperture_at(position)
+
+    def apertures_to_z(self, apertures, finger='both'):
+        '''
+        vectorized aperture_to_z for scoring many candidate widths
+        @param apertures: array of apertures in mm, as aperture_to_z takes them
+        @return: fingertip z-offset (mm) at the servo position each aperture is commanded to, and
+                 whether that position is inside the theta limits of the finger(s)
+        '''
+        apertures = np.asarray(apertures, dtype=float)
+        apertures = (apertures / 2.0) if finger=='both' else apertures
+        names = ['left', 'right'] if finger=='both' else [finger]
+        z = np.zeros(apertures.shape)
+        valid = np.ones(apertures.shape, dtype=bool)
+        for name in names:
+            kinematics = self.kinematics[name]
+            positions = kinematics.position(np.atleast_1d(apertures)).reshape(apertures.shape)
+            reachable = positions >= 0
+            z += np.where(reachable, kinematics.z_at(np.maximum(positions, 0)), np.nan) / len(names)
+            valid &= reachable & kinematics.valid_at(np.maximum(positions, 0))
+        return z, valid
+
     # general flow: desired mm distance
     # --> call distance_to_theta(mm)
     # --> call position(theta) to move gripper
@@ -170,27 +451,51 @@ class Gripper:
         aperture = (aperture / 2.0) if finger=='both' else aperture
         return self.theta_to_z(self.aperture_to_theta(aperture), debug=debug)
 
-    def set_goal_aperture(self, aperture, finger='both', debug=False, record_load=True):
+    def set_goal_aperture(self, aperture, finger='both', debug=False, record_load=True, monitor=None, settle=True):
+        # settle: without record_load, return as soon as the fingers stop instead of after the estimate
         aperture = (aperture / 2.0) if finger=='both' else aperture
         # if both, just calculates delta_ticks for right finger (ugly code).
-        delta_ticks = self.theta_to_position(
-                      self.aperture_to_theta(aperture), finger=finger)
-        delta_ticks = np.abs(delta_ticks - self.get_position(finger='right' if finger=='both' else finger))
+        delta_ticks = self.aperture_to_position(aperture, finger='right' if finger=='both' else finger)
+        delta_ticks = np.abs(delta_ticks - self.get_position(finger='right' if finger=='both' else finger, fresh=True))
         # each tick (0.29 deg) at speed 100 (~11 rpm) takes 4.4ms to actuate + 1ms buffer
         wait_time = delta_ticks * self.delay * 2.0 # fat buffer for now
         if debug:
             print(f"delta_ticks: {delta_ticks}, wait_time: {wait_time}")
         if record_load:
-            return self.set_goal_aperture_record_load(aperture, finger=finger, debug=debug)
-        theta = self.aperture_to_theta(aperture)
+            return self.set_goal_aperture_record_load(aperture, finger=finger, debug=debug, monitor=monitor)
         if finger=='both':
-            self.Finger1.set_goal_position(self.theta_to_position(theta, finger='left', debug=debug))
-            self.Finger2.set_goal_position(self.theta_to_position(theta, finger='right', debug=debug))
+            self.set_goal_position_both(self.aperture_to_position(aperture, finger='left', debug=debug),
+                                        self.aperture_to_position(aperture, finger='right', debug=debug))
         elif finger=='left':
-            self.Finger1.set_goal_position(self.theta_to_position(theta, finger='left', debug=debug))
+            self.Finger1.set_goal_position(self.aperture_to_position(aperture, finger='left', debug=debug))
         elif finger=='right':
-            self.Finger2.set_goal_position(self.theta_to_position(theta, finger='right', debug=debug))
-        time.sleep(wait_time)
+            self.Finger2.set_goal_position(self.aperture_to_position(aperture, finger='right', debug=debug))
+        if settle:
+            # wait_until_settled estimates the upper bound from the commanded speed, which may be below self.speed
+            self.wait_until_settled(finger=finger, debug=debug)
+        else:
+            self.clock.sleep(wait_time)
+
+    def stage_goal_aperture(self, aperture, finger='both', speed=None, torque=None, debug=False):
+        # register the goal, and optionally speed and torque limit, in the servos without moving them
+        # nothing moves until trigger_staged(), which starts every staged finger at the same instant
+        aperture = (aperture / 2.0) if finger=='both' else aperture
+        names = ['left', 'right'] if finger=='both' else [finger]
+        servos = [self.Finger1 if name=='left' else self.Finger2 for name in names]
+        positions = [self.aperture_to_position(aperture, finger=name, debug=debug) for name in names]
+        self.bus.stage_goal_position(servos, positions,
+                                     None if speed is None else [speed] * len(servos),
+                                     None if torque is None else [torque] * len(servos))
+        # same estimate as set_goal_aperture, from the last finger staged
+        delta_ticks = np.abs(positions[-1] - self.get_position(finger=names[-1], fresh=True))
+        return delta_ticks * self.delay * 2.0
+
+    def trigger_staged(self, finger=None, timeout=None):
+        # one broadcast ACTION starts all staged writes
+        # with finger set, wait until those fingers settle, timeout as in wait_until_settled
+        self.bus.action()
+        if finger is not None:
+            return self.wait_until_settled(finger=finger, timeout=timeout)
 
     # return aperture, but with math.cos
     def theta_to_aperture(self, theta):
@@ -241,19 +546,39 @@ class Gripper:
                 return getattr(self.Finger2, action_func_name)(arg)
 
     # setters
+    def set_goal_position_both(self, pos_left, pos_right):
+        # one SyncWrite packet, so both fingers start moving at the same time
+        self.bus.sync_set_goal_position([self.Finger1, self.Finger2], [pos_left, pos_right])
+
     def set_force(self, force, finger='both', debug=False):
         # see comments in check_slip as to why we need to halve the force
         # tbh, we might not actually need to halve the force here
         # so long as check_slip halves the force.
         # TODO: figure this out
+        load = self.force_to_load(force, finger=finger)
+        if debug:
+            print(f'converted load: {load}')
+        self.set_torque(load, finger=finger)
+
+    def hold_force(self, force, finger='both', duration=2.0, until_settled=True, rate_hz=100.0, debug=False):
+        '''
+        closed-loop alternative to set_force: move the goals until the load of each finger in contact
+        matches force, at rate_hz, see ForceController
+        @param force: contact force (N) of each finger
+        @return: ForceController report, status 'lost' if the object is gone from between the fingers
+        '''
+        self.force_controller = ForceController(self, rate_hz=rate_hz, debug=debug)
+        report = self.force_controller.run(force, finger=finger, duration=duration, until_settled=until_settled)
+        if debug:
+            print(format_force_report(report))
+        return report
+
+    def force_to_load(self, force, finger='both'):
         force = force / 2.0 if finger=='both' else force
         # convert N to unitless load value
         force = min(force, 16.1)
         force = max(force, 0.15)
-        load = int(self.N_to_load(force))
-        if debug:
-            print(f'converted load: {load}')
-        self.set_torque(load, finger=finger)
+        return int(self.N_to_load(force))
 
     def set_torque(self, torqueLimit, finger='both'):
         self.apply_to_fingers('set_torque_limit', torqueLimit, finger=finger, noarg=False)
@@ -271,14 +596,15 @@ class Gripper:
         if debug:
             print(f'margin_ax12: {margin_ax12}')
             print(f'flexibility_ax12: {flexibility_ax12}')
-        self.apply_to_fingers('set_cw_compliance_margin', margin_ax12, finger=finger, noarg=False)
-        self.apply_to_fingers('set_ccw_compliance_margin', margin_ax12, finger=finger, noarg=False)
-        self.apply_to_fingers('set_cw_compliance_slope', flexibility_ax12, finger=finger, noarg=False)
-        self.apply_to_fingers('set_ccw_compliance_slope', flexibility_ax12, finger=finger, noarg=False)
+        self.apply_parameters({'compliance_margin': margin_ax12, 'compliance_slope': flexibility_ax12}, finger=finger)
 
     # getters
-    def get_position(self, finger='both'):
-        return(self.apply_to_fingers('get_present_position', None, finger=finger, noarg=True))
+    def get_position(self, finger='both', fresh=False):
+        state = self.read_state(finger=finger, fresh=fresh)
+        if finger=='both':
+            return [state[0].position, state[1].position]
+        else:
+            return state.position
 
     def get_goal_distance(self, finger='both'):
         if finger=='both':
@@ -286,32 +612,54 @@ class Gripper:
         else:
             return self.goal_distance_f1 if finger=='left' else self.goal_distance_f2
 
-    def get_aperture(self, finger='both'):
+    def get_aperture(self, finger='both', fresh=False):
         '''
+        @param fresh: read the servos even when telemetry has a recent sample, for control decisions
         @return aperture in mm, either between both fingers, or from finger to x-center
         '''
         # perform inverse calculations of theta_to_position, distance_to_theta
-        f1_theta = self.position_to_theta(self.get_position(finger='left'), finger='left')
-        f2_theta = self.position_to_theta(self.get_position(finger='right'), finger='right')
-        f1_aperture  = self.theta_to_aperture(f1_theta)
-        f2_aperture  = self.theta_to_aperture(f2_theta)
+        position = self.get_position(finger='both', fresh=fresh)
+        f1_aperture  = self.position_to_aperture(position[0], finger='left')
+        f2_aperture  = self.position_to_aperture(position[1], finger='right')
         if finger == 'both':
             return f1_aperture + f2_aperture
         else:
             return f1_aperture if finger=='left' else f2_aperture
 
+    def read_state(self, finger='both', fresh=False):
+        # position, speed, load, voltage and temperature in one transaction (one per finger without bulk read)
+        # with telemetry running, a recent enough sample is returned instead unless fresh is set
+        if not fresh and self.telemetry is not None and self.telemetry.age() <= self.telemetry_max_age:
+            _, state = self.telemetry.get_latest()
+            if finger=='both':
+                return list(state)
+            return state[0] if finger=='left' else state[1]
+        servos = [self.Finger1, self.Finger2] if finger=='both' else [self.Finger1 if finger=='left' else self.Finger2]
+        state = self.bus.read_states(servos)
+        if self.recorder is not None:
+            self.recorder.record_states(state, servos)
+        return state if finger=='both' else state[0]
+
     def get_temp(self, finger='both'):
-        return self.apply_to_fingers('get_temperature', None, finger=finger, noarg=True)
+        state = self.read_state(finger=finger)
+        if finger=='both':
+            return [state[0].temperature, state[1].temperature]
+        else:
+            return state.temperature
 
     def get_force(self, finger='both'):
-        load = self.get_load(finger=finger)
+        state = self.read_state(finger=finger)
         if finger=='both':
-            return [self.load_to_N(load[0]), self.load_to_N(load[1])]
+            return [self.load_to_N(state[0].load), self.load_to_N(state[1].load)]
         else:
-            return self.load_to_N(load)
+            return self.load_to_N(state.load)
 
     def get_load(self, finger='both'):
-        return self.apply_to_fingers('get_load', None, finger=finger, noarg=True)
+        state = self.read_state(finger=finger)
+        if finger=='both':
+            return [state[0].load, state[1].load]
+        else:
+            return state.load
 
     def get_torque(self, finger='both'):
         return self.apply_to_fingers('get_torque_limit', None, finger=finger, noarg=True)
@@ -333,15 +681,20 @@ class Gripper:
         speed = min(max_poke_speed, speed) # max speed is 0.20 m/s
         bit_speed = int((speed / max_poke_speed) * 500)
         self.set_goal_aperture(104, record_load=False)
-        self.set_torque(1023) # max torque
-        self.set_speed(bit_speed)
         if direction == 'left' or direction == 'l':
-            self.set_goal_aperture(aperture, finger='right', record_load=False)
+            poker, idle = 'right', 'left'
         elif direction == 'right' or direction == 'r':
-            self.set_goal_aperture(aperture, finger='left', record_load=False)
-        time.sleep(self.delay * 3)
+            poker, idle = 'left', 'right'
+        else:
+            # max torque
+            self.apply_parameters({'torque': 1023, 'speed': bit_speed})
+            return
+        # max torque and poke speed on both fingers, and the poke goal, all start with one ACTION
+        self.stage_goal_aperture(104 / 2.0, finger=idle, speed=bit_speed, torque=1023)
+        wait_time = self.stage_goal_aperture(aperture, finger=poker, speed=bit_speed, torque=1023)
+        self.trigger_staged(finger=poker, timeout=wait_time + self.delay * 3)
 
-    def deligrasp(self, x, fc, dx, df, complete=True, debug=False): 
+    def deligrasp(self, x, fc, dx, df, complete=True, debug=False, object_id=0): 
         '''
         @param x: initial goal aperture (mm)
         @param fc: initial force (N) and requisite contact force to stop grasping
@@ -350,125 +703,163 @@ class Gripper:
         @return xf: final goal aperture (mm)
         @return ff: final force (N) applied when fc is met
         @return k: spring constant (N/mm) of the object grasped
+        @return grasp_log: GRASP_RECORD row of every step, also appended to the grasp log if one is open
+        @param object_id: object number the grasp log rows are tagged with
         '''
         grasp_log = []
-        self.set_force(fc, 'both')
+        start = self.clock.now()
         goal_aperture = x
-        self.set_goal_aperture(goal_aperture + dx, finger='both', record_load=False)
-        # Move to the initial goal aperture to attempt the grasp
-        load_data = self.set_goal_aperture(goal_aperture, finger='both', record_load=True)
-        curr_aperture = self.get_aperture(finger='both')
+        previous_phase = self.bus.stats.set_phase('pregrasp')
+        # torque limit for fc and the pre-grasp aperture reach both fingers together
+        wait_time = self.stage_goal_aperture(goal_aperture + dx, finger='both', torque=self.force_to_load(fc, 'both'))
+        self.trigger_staged(finger='both', timeout=wait_time)
+        # Move to the initial goal aperture to attempt the grasp, stopping as soon as both fingers reach fc
+        self.bus.stats.set_phase('grasp')
+        monitor = self.contact_force_monitor(fc, 'both')
+        load_data = self.set_goal_aperture(goal_aperture, finger='both', record_load=True, monitor=monitor)
+        curr_aperture = self.get_aperture(finger='both', fresh=True)
         # initialize force to contact force
         applied_force = fc
-        prev_aperture = curr_aperture
-        k_avg = []
         # Checking for slip at the initial attempt, indicating whether the grip is firm or needs adjustment
-        slippage, avg_force, max_force = self.check_slip(load_data, fc, 'both')
+        slippage, avg_force, max_force = self.check_slip_monitor(monitor, 'both')
+        grasp_log.append((self.grasp_session, object_id, self.grasp_count, 0, self.clock.now() - start,
+                          goal_aperture, curr_aperture, applied_force, *avg_force, *max_force, slippage, 0.0))
+        self.bus.stats.set_phase('adjust')
         while slippage:
             goal_aperture -= dx
             if np.mean(avg_force) > 0.10: # low-pass filter force readings so we don't increase force when there is no contact
                 applied_force += df
             self.set_force(applied_force, 'both')
-            load_data = self.set_goal_aperture(goal_aperture, finger='both', record_load=True)
-            curr_aperture = self.get_aperture(finger='both')
+            monitor = self.contact_force_monitor(fc, 'both')
+            load_data = self.set_goal_aperture(goal_aperture, finger='both', record_load=True, monitor=monitor)
+            curr_aperture = self.get_aperture(finger='both', fresh=True)
             if debug:
                 print(f"Previous aperture: {curr_aperture} mm, Goal Aperture: {goal_aperture} mm, Applied Force: {applied_force} N.")
                 print(f"Current aperture: {curr_aperture} mm")
-            slippage, avg_force, max_force = self.check_slip(load_data, fc, 'both')
-            distance = abs(curr_aperture - prev_aperture)
-            k = np.mean(avg_force) * distance * 1000.0
-            k_avg.append(k)
-            grasp_log.append({'aperture': curr_aperture, 'contact_force': avg_force, 'applied_force': applied_force, 'k': k})
-            prev_aperture = curr_aperture
-            
-        time.sleep(self.delay * 5)
+            slippage, avg_force, max_force = self.check_slip_monitor(monitor, 'both')
+            grasp_log.append((self.grasp_session, object_id, self.grasp_count, len(grasp_log), self.clock.now() - start,
+                              goal_aperture, curr_aperture, applied_force, *avg_force, *max_force, slippage, 0.0))
+
+        grasp_log = np.array(grasp_log, dtype=GRASP_RECORD)
+        grasp_log['k'] = step_stiffness(grasp_log)
+        k_avg = list(grasp_log['k'][1:])
+        self.grasp_count += 1
+        if self.grasp_store is not None:
+            self.grasp_store.append(grasp_log)
+        self.clock.sleep(self.delay * 5)
         # final adjustment
+        self.bus.stats.set_phase('complete' if complete else 'release')
         if complete:
-            curr_aperture = self.get_aperture(finger='both')
+            curr_aperture = self.get_aperture(finger='both', fresh=True)
             self.set_goal_aperture(curr_aperture - dx, finger='both', record_load=False)
         else:
             self.open_gripper()
         if debug:
             print(f"Final aperture: {curr_aperture} mm, Controller Goal Aperture: {goal_aperture} mm, Applied Force: {applied_force} N.")
             print(f"Spring Constants: {k_avg} N/m")
-        print(grasp_log)
+            print(grasp_log)
+        self.bus.stats.set_phase(previous_phase)
         return curr_aperture, applied_force, k_avg, grasp_log
 
     # gripper motion
-    def close_until_contact_force(self, stop_aperture, stop_force, finger='both', debug='False'):
+    def close_until_contact_force(self, stop_aperture, stop_force, finger='both', debug='False', sweep=None):
         stop_load = self.N_to_load(stop_force)
         stop_ax12 = None
         delta = None
         sign = None
-        curr_pos = self.get_position(finger=finger)
+        curr_pos = self.get_position(finger=finger, fresh=True)
         if finger=='both':
             stop_ax12 = [
-                self.theta_to_position(self.aperture_to_theta(stop_aperture), finger='left', debug=debug ),
-                self.theta_to_position(self.aperture_to_theta(stop_aperture), finger='right', debug=debug )
+                self.aperture_to_position(stop_aperture, finger='left', debug=debug),
+                self.aperture_to_position(stop_aperture, finger='right', debug=debug)
             ]
             delta = np.array(stop_ax12) - np.array(curr_pos)
         else:
-            stop_ax12 = self.theta_to_position(self.aperture_to_theta(stop_aperture), finger=finger, debug=debug)
+            stop_ax12 = self.aperture_to_position(stop_aperture, finger=finger, debug=debug)
             delta = stop_ax12 - curr_pos
         sign = np.sign(delta)
 
-        if finger=='both':
-            p1 = threading.Thread(target=self.close_until_contact_force_helper, args=(delta[0], stop_load, sign[0], 'left', debug))
-            p2 = threading.Thread(target=self.close_until_contact_force_helper, args=(delta[1], stop_load, sign[1], 'right', debug))
-            p1.start()
-            p2.start()
-            self.goal_distance_both = self.get_distance(finger='both')
+        if self.sweep if sweep is None else sweep:
+            fingers = ['left', 'right'] if finger=='both' else [finger]
+            stop_ax12 = stop_ax12 if finger=='both' else [stop_ax12]
+            pld = [[[], []] for _ in fingers]
+            frozen = self.sweep_helper(fingers, stop_ax12, pld, stop_load=stop_load, debug=debug)
+            for i, position in enumerate(frozen):
+                if position is not None:
+                    print(f'{fingers[i]} finger reached stop load: {pld[i][1][-1]} at position: {position}')
+        elif finger=='both':
+            # both helper threads share the bus, let its executor thread serialize their packets
+            started = self.bus.executor is None
+            self.bus.start_executor()
+            try:
+                p1 = threading.Thread(target=self.close_until_contact_force_helper, args=(stop_ax12[0], stop_load, sign[0], 'left', debug))
+                p2 = threading.Thread(target=self.close_until_contact_force_helper, args=(stop_ax12[1], stop_load, sign[1], 'right', debug))
+                p1.start()
+                p2.start()
+                p1.join()
+                p2.join()
+            finally:
+                # later transactions go straight to the port again, unless someone else runs the executor
+                if started:
+                    self.bus.stop_executor()
         else:
-            self.close_until_contact_force_helper(delta, stop_ax12, sign, finger=finger, debug=debug)
+            self.close_until_contact_force_helper(stop_ax12, stop_load, sign, finger=finger, debug=debug)
+        self.goal_distance_both = self.get_aperture(finger='both', fresh=True)
 
     # only for left or right finger, not both
     def close_until_contact_force_helper(self, stop_pos, stop_load, sign, finger='left', debug=False):
         finger_ax12 = self.Finger1 if finger=='left' else self.Finger2
         curr_pos = finger_ax12.get_present_position()
-        time.sleep(self.latency)
+        self.clock.sleep(self.latency)
         for next_pos in range(curr_pos, stop_pos, sign * 1):
             finger_ax12.set_goal_position(next_pos)
-            time.sleep(self.delay * 2)
-            curr_pos = finger_ax12.get_present_position()
-            curr_load = finger_ax12.get_load()
-            time.sleep(self.latency)
+            self.clock.sleep(self.delay * 2)
+            state = self.read_state(finger=finger, fresh=True)
+            curr_pos, curr_load = state.position, state.load
+            self.clock.sleep(self.latency)
             if curr_load > stop_load:
                 force = self.load_to_N(curr_load)
-                distance = self.get_aperture(finger=finger)
+                distance = self.get_aperture(finger=finger, fresh=True)
                 print(f'{finger} finger reached stop force: {force} at distance: {distance}')
                 print(f'{finger} finger reached stop load: {curr_load} at position: {curr_pos}')
                 # todo: set goal_distance_fx class variable, but not really necessary
                 finger_ax12.set_goal_position(curr_pos)
                 break
 
-    def set_goal_aperture_record_load(self, stop_aperture, finger='both', debug='False'):
+    def set_goal_aperture_record_load(self, stop_aperture, finger='both', debug='False', sweep=None, monitor=None):
+        # with a ContactForceMonitor, the fingers stop where it is met instead of at stop_aperture
         stop_ax12 = None
         delta = None
         sign = None
-        curr_pos = self.get_position(finger=finger)
+        curr_pos = self.get_position(finger=finger, fresh=True)
         if finger=='both':
             stop_ax12 = [
-                self.theta_to_position(self.aperture_to_theta(stop_aperture), finger='left', debug=debug ),
-                self.theta_to_position(self.aperture_to_theta(stop_aperture), finger='right', debug=debug )
+                self.aperture_to_position(stop_aperture, finger='left', debug=debug),
+                self.aperture_to_position(stop_aperture, finger='right', debug=debug)
             ]
             delta = np.array(stop_ax12) - np.array(curr_pos)
         else:
-            stop_ax12 = self.theta_to_position(self.aperture_to_theta(stop_aperture), finger=finger, debug=debug)
+            stop_ax12 = self.aperture_to_position(stop_aperture, finger=finger, debug=debug)
             delta = stop_ax12 - curr_pos
         sign = np.sign(delta)
 
+        if self.sweep if sweep is None else sweep:
+            fingers = ['left', 'right'] if finger=='both' else [finger]
+            pld = [[[], []] for _ in fingers]
+            self.sweep_helper(fingers, stop_ax12 if finger=='both' else [stop_ax12], pld, debug=debug, monitor=monitor)
+            return (pld[0], pld[1]) if finger=='both' else pld[0]
         if finger=='both':
             pos_load_l = [[], []]
             pos_load_r = [[], []]
-            self.record_load_both_helper(stop_ax12, sign, [pos_load_l, pos_load_r], debug)
+            self.record_load_both_helper(stop_ax12, sign, [pos_load_l, pos_load_r], debug, monitor=monitor)
             return pos_load_l, pos_load_r
         else:
             pos_load = [[], []]
-            self.record_load_helper(stop_ax12, sign, pos_load, finger=finger, debug=debug)
+            self.record_load_helper(stop_ax12, sign, pos_load, finger=finger, debug=debug, monitor=monitor)
             return pos_load
 
     # only for left or right finger, not both
-    def record_load_helper(self, stop_pos, sign, pld, finger='left', debug=False):
+    def record_load_helper(self, stop_pos, sign, pld, finger='left', debug=False, monitor=None):
         '''
         @param stop_pos: position to stop at
         @param sign: direction to move in
@@ -476,27 +867,30 @@ class Gripper:
         '''
         finger_ax12 = self.Finger1 if finger=='left' else self.Finger2
         curr_pos = finger_ax12.get_present_position()
-        time.sleep(self.latency)
+        self.clock.sleep(self.latency)
         for next_pos in range(curr_pos, stop_pos, sign * 1):
             finger_ax12.set_goal_position(next_pos)
-            time.sleep(self.delay * 2)
-            curr_pos = finger_ax12.get_present_position()
-            curr_load = finger_ax12.get_load()
-            time.sleep(self.latency)
+            self.clock.sleep(self.delay * 2)
+            state = self.read_state(finger=finger, fresh=True)
+            curr_pos, curr_load = state.position, state.load
+            self.clock.sleep(self.latency)
             if debug:
                 print(f'position: {curr_pos}, load: {curr_load}')
             pld[0].append(curr_pos)
             pld[1].append(curr_load)
+            if monitor is not None and monitor.add(0, curr_load):
+                finger_ax12.set_goal_position(curr_pos)
+                break
 
     # only for left or right finger, not both
-    def record_load_both_helper(self, stop_pos, sign, pld, debug=False):
+    def record_load_both_helper(self, stop_pos, sign, pld, debug=False, monitor=None):
         '''
         @param stop_pos: position to stop at
         @param sign: direction to move in
         @param pld: position-load data array
         '''
-        curr_pos = self.get_position(finger='both')
-        time.sleep(self.latency)
+        curr_pos = self.get_position(finger='both', fresh=True)
+        self.clock.sleep(self.latency)
         # sign[sign == 0] = 1 # if 0, set to 1
         sign[0] = 1 if sign[0] == 0 else sign[0]    
         sign[1] = 1 if sign[1] == 0 else sign[1]
@@ -505,19 +899,83 @@ class Gripper:
         # get stop position of shorter range
         stub = stop_pos[0] if len(lrange) < len(rrange) else stop_pos[1]
         for next_pos_l, next_pos_r in itertools.zip_longest(lrange, rrange, fillvalue=stub):
-            self.Finger1.set_goal_position(next_pos_l)
-            self.Finger2.set_goal_position(next_pos_r)
-            time.sleep(self.delay * 2)
-            curr_pos = self.get_position(finger='both')
-            curr_load = self.get_load(finger='both')
-            time.sleep(self.delay)
+            self.set_goal_position_both(next_pos_l, next_pos_r)
+            self.clock.sleep(self.delay * 2)
+            state = self.read_state(finger='both', fresh=True)
+            curr_pos = [state[0].position, state[1].position]
+            curr_load = [state[0].load, state[1].load]
+            self.clock.sleep(self.latency)
             if debug:
-                print(f'left position: {curr_pos[0]}, load: {curr_load[1]}')
+                print(f'left position: {curr_pos[0]}, load: {curr_load[0]}')
                 print(f'right position: {curr_pos[1]}, load: {curr_load[1]}')
             pld[0][0].append(curr_pos[0])
             pld[1][0].append(curr_pos[1])
             pld[0][1].append(curr_load[0])
             pld[1][1].append(curr_load[1])
+            if monitor is not None:
+                monitor.add(0, curr_load[0])
+                if monitor.add(1, curr_load[1]):
+                    self.set_goal_position_both(curr_pos[0], curr_pos[1])
+                    break
+
+    def sweep_helper(self, fingers, stop_pos, pld, stop_load=None, speed=None, debug=False, monitor=None):
+        '''
+        command the final goal once, then sample position and load at the bus rate until each finger
+        reaches its goal, stalls, or (with stop_load) first exceeds stop_load, where its goal is frozen
+        @param fingers: ['left'], ['right'] or ['left', 'right']
+        @param stop_pos: goal position of each finger
+        @param pld: position-load data array of each finger, [[positions], [loads]]
+        @param stop_load: load magnitude to freeze a finger at, None to sweep to the goal
+        @param speed: moving speed of the sweep, self.sweep_speed or self.speed if None
+        @param monitor: ContactForceMonitor fed every sample, every finger is frozen once it is met
+        @return: position each finger's goal was frozen at, None for fingers that were not
+        '''
+        servos = [self.Finger1 if name=='left' else self.Finger2 for name in fingers]
+        finger = 'both' if len(fingers) == 2 else fingers[0]
+        speed = speed if speed is not None else (self.sweep_speed if self.sweep_speed is not None else self.speed)
+        ticks_per_s = speed * TICKS_PER_S_PER_SPEED_UNIT
+        state = self.read_state(finger=finger, fresh=True)
+        states = state if finger=='both' else [state]
+        start = self.clock.now()
+        # twice the travel time of the longest move, the same buffer as the stepping loops
+        deadline = start + 2.0 * max(abs(int(goal) - s.position) for goal, s in zip(stop_pos, states)) / ticks_per_s + 0.1
+        # a finger that has not moved for three ticks' time is stalled against its torque limit
+        stall_s = 3.0 / ticks_per_s
+        self.bus.sync_set_goal_position(servos, [int(goal) for goal in stop_pos], [speed] * len(servos))
+        last_pos = [s.position for s in states]
+        last_move = [start] * len(servos)
+        active = [True] * len(servos)
+        frozen = [None] * len(servos)
+        while any(active) and self.clock.now() < deadline:
+            state = self.read_state(finger=finger, fresh=True)
+            states = state if finger=='both' else [state]
+            now = self.clock.now()
+            for i, s in enumerate(states):
+                if not active[i]:
+                    continue
+                if debug:
+                    print(f'{fingers[i]} position: {s.position}, load: {s.load}')
+                pld[i][0].append(s.position)
+                pld[i][1].append(s.load)
+                if monitor is not None:
+                    monitor.add(i, s.load)
+                if stop_load is not None and load_magnitude(s.load) > stop_load:
+                    servos[i].set_goal_position(s.position)
+                    frozen[i] = s.position
+                    active[i] = False
+                elif abs(s.position - int(stop_pos[i])) <= 1:
+                    active[i] = False
+                elif s.position != last_pos[i]:
+                    last_pos[i] = s.position
+                    last_move[i] = now
+                elif now - last_move[i] > stall_s:
+                    active[i] = False
+            if monitor is not None and monitor.met():
+                self.bus.sync_set_goal_position(servos, [s.position for s in states])
+                break
+        if speed != self.speed:
+            self.set_speed(self.speed, finger=finger)
+        return frozen
 
     def check_slip(self, pos_load, stop_force, finger='both'):
         '''
@@ -531,16 +989,12 @@ class Gripper:
         # at static equilibrium, the upward frictional force is equal to the object weight / mu (friction coefficient)
         # the frictional force applied by either finger, if equal, is thus (weight / 2*mu)
         # thus the stop force (ie the contact force on the motor), for an independently actuated finger, is (weight / 2*mu)
-        stop_force = stop_force / 2.0 if finger=='both' else stop_force
-        stop_force = max(0.15, stop_force) # the gripper sensing floor is ~0.15 N
-        stop_load = self.N_to_load(stop_force)
+        stop_force, stop_load = self.slip_stop_load(stop_force, finger)
         # check if stop_load is met at any point in pos_load
         # check if any value in pos_load is greater than stop_load
         if finger=='both':
             # subtract 1023 from load values greater than 1023
-            load_r, load_l = np.array(pos_load[0][1]), np.array(pos_load[1][1])
-            load_r[load_r > 1023] -= 1023
-            load_l[load_l > 1023] -= 1023
+            load_r, load_l = load_magnitude(np.array(pos_load[0][1])), load_magnitude(np.array(pos_load[1][1]))
             # get average load
             avg_r = self.load_to_N(np.mean(load_r))
             avg_l = self.load_to_N(np.mean(load_l))
@@ -558,8 +1012,7 @@ class Gripper:
             # return not np.mean([avg_r, avg_l]) > stop_force # also bad
             # return not np.mean([max_r, max_l]) > stop_force 
         else:
-            load = np.array(pos_load[1])
-            load[load > 1023] -= 1023
+            load = load_magnitude(np.array(pos_load[1]))
             avg_f = self.load_to_N(np.mean(load))
             max_f = self.load_to_N(np.max(load))
             print(f"max: {max_f} N")
@@ -567,42 +1020,68 @@ class Gripper:
             return [not any(load > stop_load), avg_f, max_f]
             
 
+    def slip_stop_load(self, stop_force, finger='both'):
+        '''
+        @return: per-finger stop force (N) and stop load of the check_slip criterion for stop_force
+        '''
+        stop_force = stop_force / 2.0 if finger=='both' else stop_force
+        stop_force = max(0.15, stop_force) # the gripper sensing floor is ~0.15 N
+        return stop_force, self.N_to_load(stop_force)
+
+    def contact_force_monitor(self, stop_force, finger='both'):
+        '''
+        @return: ContactForceMonitor of the check_slip criterion, to pass to set_goal_aperture
+        '''
+        return ContactForceMonitor(self.slip_stop_load(stop_force, finger)[1], fingers=2 if finger=='both' else 1)
+
+    def check_slip_monitor(self, monitor, finger='both'):
+        '''
+        check_slip from the running values of a ContactForceMonitor, without going over the trace
+        @return: same as check_slip
+        '''
+        if finger=='both':
+            return [not monitor.met(),
+                    [self.load_to_N(monitor.mean(0)), self.load_to_N(monitor.mean(1))],
+                    [self.load_to_N(monitor.max[0]), self.load_to_N(monitor.max[1])]]
+        return [not monitor.met(), self.load_to_N(monitor.mean(0)), self.load_to_N(monitor.max[0])]
+
     # convert unitless load values to force normal load at gripper contact point
     def load_to_N(self, load):
         '''
         @param load: unitless load value in bits, 0-2048. 0-1023 represents CW load, 1024-2047 represents CCW load
+                     a scalar or an array; integer loads are looked up in LOAD_TO_N_TABLE
         '''
         # derived by Stephen Otto empirically
         # see eqn on p17, figure 14 on p18 of: https://www.proquest.com/docview/2868478510?%20
-        if load > 1023:
-            load = load - 1023
-        N = -0.00001889 * load**2 + 0.038399 * load - 3.4073
-        if load < 100:
-            # made up polynomial to approximate the low load region
-            N = 0.0025 * load - 0.0000007 * load**2
-        return N
+        # below a load of 100 it uses a made up polynomial to approximate the low load region
+        load = np.asarray(load)
+        if np.issubdtype(load.dtype, np.integer):
+            N = LOAD_TO_N_TABLE[load]
+        else:
+            # averaged loads fall between table entries
+            N = load_poly_N(load)
+        return float(N) if np.ndim(N) == 0 else N
 
     def N_to_load(self, N):
         '''
-        @param N: force normal load at finger contact in N
+        @param N: force normal load at finger contact in N, a scalar or an array
+        @return: load magnitude 0-1023, 1023 for forces beyond the fit
         '''
         # derived by Stephen Otto empirically
         # see eqn on p17, figure 14 on p18 of: https://www.proquest.com/docview/2868478510?%20
-        # invert load_to_N
-        low_load = N < 0.25 
-        a = -0.00001889 if not low_load else -0.0000007
-        b = 0.038399 if not low_load else 0.0025
-        c = (-3.4073 - N) if not low_load else (-N)
-        discriminant = b**2 - 4*a*c
-        if discriminant < 0:
-            # return None  # No real solution
-            return 0 # No real solution
-        else:
-            load = (-b + math.sqrt(discriminant)) / (2*a)
-            return load
+        # invert load_to_N: find the first table load reaching N, interpolate from the one before
+        N = np.asarray(N, dtype=float)
+        i = np.clip(np.searchsorted(LOAD_N_MONOTONE, N, side='left'), 1, 1023)
+        low, high = LOAD_N_MONOTONE[i - 1], LOAD_N_MONOTONE[i]
+        load = (i - 1) + np.clip((N - low) / np.where(high > low, high - low, 1.0), 0.0, 1.0)
+        load = np.where(N > LOAD_N_MONOTONE[-1], 1023.0, load)
+        return float(load) if load.ndim == 0 else load
 
     def disconnect(self):
-        Ax12.disconnect()
+        self.stop_telemetry()
+        self.stop_recording()
+        self.stop_grasp_log()
+        self.bus.disconnect()
 
 if __name__ =="__main__":
     Controller = Gripper()
@@ -0,0 +1,159 @@
+"""
+gripper_sim.py
+Gripper against simulated AX-12s on a virtual clock, grasping objects modelled as springs.
+
+    sim = GripperSim()
+    sim.place(SpringObject(width=50.0, stiffness=2.0, friction=0.6, weight=1.5))
+    sim.gripper.deligrasp(60.0, 1.0, 2.0, 0.25)
+    sim.held(), sim.clock.now()
+
+The object is seen through each finger's linkage (FingerKinematics of the Gripper), so contact
+happens at the aperture the finger geometry gives, and the spring force is turned into servo load
+with the same calibration Gripper.load_to_N reads it back with. Servo speed, torque limit,
+compliance margin, slope and punch are modelled by SimAx12.
+"""
+
+import numpy as np
+
+from magpie.ax12 import DynamixelBus, ADDR_AX_GOAL_POSITION_L
+from magpie.dynamixel_sim import SimAx12, SimPortHandler, VirtualClock
+from magpie.gripper import Gripper, LOAD_N_MONOTONE
+from magpie.kinematics import POSITIONS
+
+
+class SpringObject:
+    """ Object between the fingers: a block `width` mm wide whose faces give like springs.
+
+    `stiffness` is in N/mm of penetration at each face, `center` offsets the object from the camera
+    center (mm, toward the right finger), and the grasp holds `weight` N while the friction on both
+    faces, `friction` times the smaller normal force, twice, carries it.
+    """
+
+    def __init__(self, width, stiffness, friction=0.5, weight=0.0, center=0.0):
+        self.width = width
+        self.stiffness = stiffness
+        self.friction = friction
+        self.weight = weight
+        self.center = center
+
+    def __repr__(self):
+        return "SpringObject(width={}, stiffness={})".format(self.width, self.stiffness)
+
+    def penetration(self, aperture, side):
+        """Returns how far (mm) a finger at `aperture` from the camera center pushes into the object"""
+        face = self.width / 2.0 + (self.center if side == 'right' else -self.center)
+        return np.maximum(0.0, face - np.asarray(aperture, dtype=float))
+
+    def force(self, aperture, side):
+        """Returns the normal force (N) at the face of `side` with the finger at `aperture`"""
+        return self.stiffness * self.penetration(aperture, side)
+
+    def held(self, forces):
+        """Returns True if the normal forces (N) of the two fingers hold the object up by friction"""
+        return min(forces) > 0.0 and 2.0 * self.friction * min(forces) >= self.weight
+
+
+class LinkageContact:
+    """ Contact model of SimAx12 for one finger on a SpringObject.
+
+    The load is tabulated over servo positions from the finger's aperture table and interpolated
+    between ticks. `direction` is the way positions move when the finger closes.
+    """
+
+    def __init__(self, obj, kinematics, side, direction):
+        self.object = obj
+        self.side = side
+        self.direction = direction
+        self.aperture = kinematics.aperture
+        self.forces = obj.force(self.aperture, side)
+        # N to load units, the inverse of the gripper's load_to_N calibration
+        self.loads = np.interp(self.forces, LOAD_N_MONOTONE, np.arange(len(LOAD_N_MONOTONE)))
+
+    def load(self, position):
+        """Returns the unsigned load the object pushes back with at `position`, scalar or array"""
+        return np.interp(position, np.arange(POSITIONS), self.loads)
+
+    def force(self, position):
+        return float(np.interp(position, np.arange(POSITIONS), self.forces))
+
+
+class GripperSim:
+    """ A Gripper on two simulated AX-12s, closing on SpringObjects in virtual time.
+
+    `positions` are the starting positions of servo 1 (left) and 2 (right).
+    """
+
+    def __init__(self, positions=(303, 729), clock=None, baudrate=1_000_000):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.servos = [SimAx12(1, positions[0], clock=self.clock), SimAx12(2, positions[1], clock=self.clock)]
+        self.bus = DynamixelBus('sim', baudrate, port_handler=SimPortHandler(self.servos, clock=self.clock))
+        self.bus.connect()
+        self.gripper = Gripper(bus=self.bus, clock=self.clock)
+        self.object = None
+
+    def place(self, obj):
+        """Put `obj` between the fingers, None takes it away"""
+        self.object = obj
+        if obj is None:
+            for servo in self.servos:
+                servo.contact = None
+            return
+        # the left finger (ID 1) closes with rising positions, the right one with falling positions
+        kinematics = self.gripper.kinematics
+        self.servos[0].contact = LinkageContact(obj, kinematics['left'], 'left', 1)
+        self.servos[1].contact = LinkageContact(obj, kinematics['right'], 'right', -1)
+
+    def forces(self):
+        """Returns the normal force (N) on the object at the left and right finger right now"""
+        if self.object is None:
+            return [0.0, 0.0]
+        for servo in self.servos:
+            servo.update()
+        return [servo.contact.force(servo.position) for servo in self.servos]
+
+    def held(self):
+        """Returns True if the object would stay in the fingers when lifted"""
+        return self.object is not None and self.object.held(self.forces())
+
+    def reset(self, positions=(303, 729)):
+        """Put the fingers back at `positions` without simulating the move, then restore the servo
+        parameters; the default positions are where open_gripper() goes"""
+        for servo, position in zip(self.servos, positions):
+            servo.position = float(position)
+            servo.set_word(ADDR_AX_GOAL_POSITION_L, position)
+            servo.update()
+        self.gripper.reset_parameters()
+
+
+def grasp_trials(objects, x, fc, dx, df, sim=None):
+    """Run deligrasp(x, fc, dx, df) once per object, in virtual time.
+    Returns a structured array with the final aperture and force, whether the object is held, the
+    normal forces at the end and the simulated duration of each grasp."""
+    sim = sim if sim is not None else GripperSim()
+    rows = np.zeros(len(objects), dtype=[('aperture', 'f8'), ('force', 'f8'), ('held', '?'),
+                                         ('force_left', 'f8'), ('force_right', 'f8'), ('time', 'f8')])
+    for i, obj in enumerate(objects):
+        sim.place(None)
+        sim.reset()
+        sim.place(obj)
+        start = sim.clock.now()
+        aperture, force = sim.gripper.deligrasp(x, fc, dx, df)[:2]
+        forces = sim.forces()
+        rows[i] = (aperture, force, sim.held(), forces[0], forces[1], sim.clock.now() - start)
+    return rows
+
+
+if __name__ == "__main__":
+    # deligrasp over random objects in virtual time
+    import contextlib, io, time
+    from magpie.ax12 import Ax12
+    Ax12.DEBUG = False
+    rng = np.random.default_rng(0)
+    objects = [SpringObject(width=rng.uniform(20.0, 50.0), stiffness=rng.uniform(0.2, 5.0),
+                            friction=rng.uniform(0.3, 0.8), weight=rng.uniform(0.2, 2.0)) for _ in range(20)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = grasp_trials(objects, 60.0, 1.0, 2.0, 0.25)
+    wall = time.perf_counter() - start
+    print(f"{len(rows)} grasps: {rows['time'].sum():.1f} s simulated in {wall:.2f} s, "
+          f"held {rows['held'].mean() * 100:.0f}%, mean final force {rows['force'].mean():.2f} N")
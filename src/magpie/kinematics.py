@@ -0,0 +1,97 @@
+"""
+kinematics.py
+Lookup tables of the gripper finger linkage over every servo position.
+
+Each table entry is computed with the same expressions as Gripper.position_to_theta,
+theta_to_aperture and theta_to_z, so forward queries are exact; inverse queries search the
+monotone part of the aperture table and return the position int() would give in
+theta_to_position(aperture_to_theta(aperture)).
+"""
+
+import numpy as np
+
+POSITIONS = 1024  # AX-12 goal and present position range, 0-1023
+
+
+class FingerKinematics:
+    """ Theta, aperture, fingertip z and theta-limit flags of one finger at positions 0-1023.
+
+    `sign` is -1 for the left finger and 1 for the right, theta_90 the servo angle (deg) at which
+    the finger bar is parallel to the camera, theta_min and theta_max the servo angle limits.
+    Lengths are in mm and follow the names of the Gripper attributes they come from.
+    """
+
+    def __init__(self, sign, theta_90, theta_min, theta_max, crank_length, offset_finger_x, offset_servo_x,
+                 finger_length, offset_finger_y, offset_servo_y):
+        self.sign = sign
+        self.theta_90 = theta_90
+        self.crank_length = crank_length
+        self.offset_finger_x = offset_finger_x
+        self.offset_servo_x = offset_servo_x
+        self.offset_x = offset_finger_x + offset_servo_x
+        positions = np.arange(POSITIONS)
+        angle = positions * 300 / 1023.0
+        self.theta = sign * (angle - theta_90)
+        self.aperture = np.sin(np.radians(self.theta)) * crank_length + offset_finger_x + offset_servo_x
+        self.z = np.cos(np.radians(self.theta)) * crank_length + (finger_length + offset_finger_y) + offset_servo_y
+        self.valid = (angle >= theta_min) & (angle <= theta_max)
+        # the aperture is monotone where |theta| <= 90 deg, the range of the arcsin in aperture_to_theta,
+        # keep that part sorted by aperture for the inverse search
+        reach = np.abs(self.theta) <= 90.0
+        order = np.argsort(self.aperture[reach], kind='stable')
+        self.search_apertures = self.aperture[reach][order]
+        self.search_positions = positions[reach][order]
+
+    def position(self, aperture):
+        """Returns the goal position of `aperture` (mm, scalar or array) as theta_to_position would.
+        A scalar out of reach of the crank raises ValueError, in arrays it gives -1."""
+        aperture = np.asarray(aperture, dtype=float)
+        reachable = np.abs(aperture - self.offset_x) <= self.crank_length
+        if self.sign > 0:
+            # position grows with aperture, int() keeps the last position at or below it
+            i = np.searchsorted(self.search_apertures, aperture, side='right') - 1
+        else:
+            # position falls as aperture grows, int() keeps the last position whose aperture is at or above it
+            i = np.searchsorted(self.search_apertures, aperture, side='left')
+        i = np.clip(i, 0, len(self.search_positions) - 1)
+        positions = np.where(reachable, self.search_positions[i], -1)
+        # within rounding of a table entry the arcsin round trip can land on either side of it, and
+        # past the last entry the crank is nearly straight, so those few apertures go through the formula
+        near = (aperture < self.search_apertures[0]) | (aperture > self.search_apertures[-1])
+        for step in (-1, 0, 1):
+            neighbour = self.aperture[np.clip(positions + step, 0, POSITIONS - 1)]
+            near |= np.abs(aperture - neighbour) <= 1e-9
+        near &= reachable
+        if np.any(near):
+            positions = np.where(near, self.formula_position(np.where(near, aperture, self.offset_x)), positions)
+        if positions.ndim == 0:
+            if not reachable:
+                raise ValueError("aperture %.2f mm is out of reach of the finger" % aperture)
+            return int(positions)
+        return positions
+
+    def formula_position(self, aperture):
+        """theta_to_position(aperture_to_theta(aperture)), term by term"""
+        movement = aperture - self.offset_finger_x - self.offset_servo_x
+        theta = np.degrees(np.arcsin(movement / self.crank_length))
+        return (((theta * self.sign) + self.theta_90) * 1023 / 300).astype(int)
+
+    def aperture_at(self, position):
+        """Returns the aperture (mm) at servo position(s) `position`"""
+        return self.lookup(self.aperture, position)
+
+    def theta_at(self, position):
+        return self.lookup(self.theta, position)
+
+    def z_at(self, position):
+        """Returns the fingertip z-offset (mm) from the camera center at servo position(s) `position`"""
+        return self.lookup(self.z, position)
+
+    def valid_at(self, position):
+        """Returns True where `position` is inside the finger's theta limits"""
+        return self.lookup(self.valid, position)
+
+    @staticmethod
+    def lookup(table, position):
+        value = table[np.asarray(position, dtype=int)]
+        return value.item() if np.ndim(value) == 0 else value
@@ -1,25 +1,23 @@
 import sys
 sys.path.append("../../")
-from time import sleep
 from traceback import print_exc
-from magpie.ax12 import Ax12
+from magpie.ax12 import Ax12, DynamixelBus
 import math
 class Motors:
    
-    def __init__(self, servoport = '/dev/ttyACM0'):
+    def __init__(self, servoport = '/dev/ttyACM0', bus = None):
         # e.g 'COM3' windows or '/dev/ttyUSB0' for Linux, '/dev/ttyACM0'
-        # sets baudrate and opens com port
-#         Ax12.DEVICENAME = '/dev/cu.usbmodem141401'
-        Ax12.DEVICENAME = servoport
-        Ax12.BAUDRATE = 1_000_000
-        # sets baudrate and opens com port
-        Ax12.connect()
+        if bus is None:
+            bus = DynamixelBus(servoport, 1_000_000)
+            # sets baudrate and opens com port
+            bus.connect()
+        self.bus = bus
         # create AX12 instance with ID 1 and 2
         #Motor ID1 should be on the right with the camera facing you
         motor_id1 = 1
         motor_id2 = 2
-        self.Motor1 = Ax12(motor_id1)
-        self.Motor2 = Ax12(motor_id2)
+        self.Motor1 = Ax12(motor_id1, self.bus)
+        self.Motor2 = Ax12(motor_id2, self.bus)
         #speed is in bits from 0-1023 for CCW; 1024 -2047 CW
         self.speed = 100
         self.Motor1.set_moving_speed(self.speed)
@@ -57,18 +55,13 @@ class Motors:
         desiredPosition1 = int(Motor1_theta*1023/(300))
         desiredPosition2 = int(Motor2_theta*1023/(300))
         print( f"Attempt to set motor positions, 1: {desiredPosition1}, 2: {desiredPosition2}" )
+        # dropped packets are retried by the bus retry policy
         try:
             self.Motor1.set_goal_position( desiredPosition1 )
             self.Motor2.set_goal_position( desiredPosition2 )
         except Exception as e:
-            print( f"Motor Error: {e}, Retry ..." )
-            sleep( 0.25 )
-            try:
-                self.Motor1.set_goal_position( desiredPosition1 )
-                self.Motor2.set_goal_position( desiredPosition2 )
-            except Exception as e:
-                print( f"\n!!! MOTOR FAILURE: {e} !!!\n" )
-                raise e
+            print( f"\n!!! MOTOR FAILURE: {e} !!!\n" )
+            raise e
 
             
     def torquelimit(self, torqueLimit):
@@ -150,7 +143,7 @@ class Motors:
         self.Motor2.get_load()
         
     def disconnect(self):
-        Ax12.disconnect()
+        self.bus.disconnect()
 
 if __name__ =="__main__":
     Controller = Motors()
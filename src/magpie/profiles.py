@@ -0,0 +1,71 @@
+"""
+profiles.py
+Named sets of servo parameters for the gripper, e.g. a stiff fast 'poke' and a soft 'delicate'.
+
+A profile file is JSON with one object per profile name; parameters a profile leaves out come
+from its 'default' profile:
+
+    {"default": {"torque": 200, "speed": 100, "compliance_margin": 1, "compliance_slope": 32},
+     "wipe": {"torque": 400, "compliance_slope": 64}}
+
+Gripper.use_profile() applies a profile by diffing it against the register shadows, so switching
+sends only the registers that change, both fingers together (see DynamixelBus.sync_write_changes).
+"""
+
+import json
+
+from magpie.ax12 import *
+
+# parameter name: (first register, length in bytes); the CW and CCW compliance registers get the same value
+PROFILE_PARAMETERS = {
+    'torque': (ADDR_AX_TORQUE_LIMIT_L, 2),
+    'speed': (ADDR_AX_GOAL_SPEED_L, 2),
+    'compliance_margin': ((ADDR_AX_CW_COMPLIANCE_MARGIN, ADDR_AX_CCW_COMPLIANCE_MARGIN), 1),
+    'compliance_slope': ((ADDR_AX_CW_COMPLIANCE_SLOPE, ADDR_AX_CCW_COMPLIANCE_SLOPE), 1),
+    'punch': (ADDR_AX_PUNCH_L, 2),
+}
+
+DEFAULT_PROFILES = {
+    'default': {'torque': 200, 'speed': 100, 'compliance_margin': 1, 'compliance_slope': 32, 'punch': 32},
+    # stiff and fast, for pushing objects
+    'poke': {'torque': 1023, 'speed': 250, 'compliance_margin': 1, 'compliance_slope': 16, 'punch': 32},
+    # low torque, soft compliance and slow approach for fragile objects
+    'delicate': {'torque': 100, 'speed': 50, 'compliance_margin': 1, 'compliance_slope': 128, 'punch': 16},
+    # firm hold while the arm moves
+    'transport': {'torque': 600, 'speed': 100, 'compliance_margin': 1, 'compliance_slope': 32, 'punch': 32},
+}
+
+
+def profile_registers(parameters):
+    """Returns {reg_num: byte} of the registers that hold `parameters`, which may be a partial profile"""
+    registers = {}
+    for name, value in parameters.items():
+        if name not in PROFILE_PARAMETERS:
+            raise RuntimeError("Profile ERROR: unknown parameter %s" % name)
+        reg_nums, length = PROFILE_PARAMETERS[name]
+        for reg_num in (reg_nums if isinstance(reg_nums, tuple) else (reg_nums,)):
+            for i, byte in enumerate(Ax12.to_bytes(value, length)):
+                registers[reg_num + i] = byte
+    return registers
+
+
+def load_profiles(path, default=None):
+    """Returns the profiles in the JSON file at `path`, each filled in from the file's 'default'
+    profile, or from `default` (DEFAULT_PROFILES['default'] if None) where the file has none"""
+    with open(path) as f:
+        profiles = json.load(f)
+    base = dict(DEFAULT_PROFILES['default'] if default is None else default)
+    base.update(profiles.get('default', {}))
+    loaded = {}
+    for name, parameters in profiles.items():
+        profile = dict(base)
+        profile.update(parameters)
+        # fail on a typo at load time rather than at the first switch
+        profile_registers(profile)
+        loaded[name] = profile
+    return loaded
+
+
+def format_profile_report(report):
+    """Returns the report of Gripper.use_profile() as one line"""
+    return "profile {name}: {registers} registers changed in {packets} SyncWrites, {latency_ms:.2f} ms".format(**report)
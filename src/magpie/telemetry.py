@@ -0,0 +1,230 @@
+"""
+telemetry.py
+Background sampling of servo present state, so that readers never wait on the serial port,
+and an append-only memory-mapped log of the samples for offline analysis.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from magpie.ax12 import BusExecutor, ADDR_AX_GOAL_POSITION_L, ADDR_AX_GOAL_POSITION_H
+
+# sample columns of each servo, in Ax12State field order
+TELEMETRY_FIELDS = ('position', 'speed', 'load', 'voltage', 'temperature')
+
+# one record per servo sample, packed little-endian; time is UNIX time, goal is NO_GOAL when the
+# shadow does not know it
+TELEMETRY_RECORD = np.dtype([('time', '<f8'), ('id', 'u1'), ('position', '<u2'), ('load', '<u2'),
+                             ('goal', '<u2'), ('temperature', 'u1')])
+NO_GOAL = 0xFFFF
+# file header: magic, header length, record count, capacity, then the record dtype as JSON
+TELEMETRY_MAGIC = b'MAGPIETL'
+TELEMETRY_HEADER_LENGTH = 4096
+TELEMETRY_HEADER = struct.Struct('<8sQQQ')
+
+
+class TelemetryPoller:
+    """ Thread that reads the present state of `servos` at rate_hz into a ring buffer.
+
+    Reads go through the bus executor at telemetry priority, so commands still jump the queue.
+    The newest sample is published as one immutable (time, states) tuple, which readers take
+    without a lock; history() copies the ring buffer for plotting and logging.
+    """
+
+    def __init__(self, bus, servos, rate_hz=50.0, capacity=1024, recorder=None):
+        """`recorder` is a TelemetryRecorder that also gets every sample"""
+        self.bus = bus
+        self.recorder = recorder
+        self.servos = list(servos)
+        self.period = 1.0 / rate_hz
+        self.capacity = capacity
+        # [sample, servo, field] and the perf_counter time of each sample
+        self.samples = np.zeros((capacity, len(self.servos), len(TELEMETRY_FIELDS)))
+        self.times = np.zeros(capacity)
+        # number of samples written so far, the newest is at (count - 1) % capacity
+        self.count = 0
+        self.latest = None
+        self.errors = 0
+        self.running = False
+        self.thread = None
+        # whether start() created the bus executor, stop() then stops it again
+        self.started_executor = False
+
+    def start(self):
+        if self.running:
+            return
+        # the poller shares the port with command threads, so the executor must own it
+        self.started_executor = self.bus.executor is None
+        self.bus.start_executor()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="{}-telemetry".format(self.bus), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        if self.started_executor:
+            # later transactions go straight to the port again
+            self.bus.stop_executor()
+            self.started_executor = False
+
+    def run(self):
+        next_time = time.perf_counter()
+        while self.running:
+            try:
+                states = self.bus.transact(BusExecutor.PRIORITY_TELEMETRY, self.bus.read_states, self.servos)
+            except RuntimeError:
+                # a missed sample only ages the latest one, the bus counts the error
+                self.errors += 1
+            else:
+                self.store(time.perf_counter(), states)
+            next_time += self.period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # fell behind, do not try to catch up with a burst of reads
+                next_time = time.perf_counter()
+
+    def store(self, t, states):
+        i = self.count % self.capacity
+        for j, state in enumerate(states):
+            self.samples[i, j] = [getattr(state, field) for field in TELEMETRY_FIELDS]
+        self.times[i] = t
+        self.count += 1
+        self.latest = (t, states)
+        if self.recorder is not None:
+            self.recorder.record_states(states, self.servos)
+
+    def get_latest(self):
+        """Returns (time, [Ax12State per servo]) of the newest sample, or None before the first"""
+        return self.latest
+
+    def age(self):
+        """Returns the age of the newest sample in seconds, inf before the first"""
+        latest = self.latest
+        return float('inf') if latest is None else time.perf_counter() - latest[0]
+
+    def history(self, n=None):
+        """Returns (times, samples) of the last `n` samples (all kept if None), oldest first,
+        with samples indexed [sample, servo, field] as in TELEMETRY_FIELDS"""
+        count = self.count
+        n = min(count, self.capacity) if n is None else min(n, count, self.capacity)
+        idx = np.arange(count - n, count) % self.capacity
+        return self.times[idx].copy(), self.samples[idx].copy()
+
+
+class TelemetryRecorder:
+    """ Append-only log of servo samples in a memory-mapped file.
+
+    The file is a fixed header followed by packed TELEMETRY_RECORD rows, or rows of another
+    structured `dtype` (e.g. grasp_log.GRASP_RECORD). Space is preallocated `capacity` rows at a
+    time, so recording writes into the mapping and allocates nothing per sample; the record count in
+    the header is updated with each sample, so a reader sees every complete row even while the
+    recorder runs. Use read_telemetry_log() to get the rows back.
+    """
+
+    def __init__(self, path, capacity=1 << 20, dtype=TELEMETRY_RECORD):
+        self.path = path
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) >= TELEMETRY_HEADER_LENGTH:
+            # keep appending to an earlier log
+            self.count, _, logged = read_telemetry_header(path)
+            if logged != self.dtype:
+                raise RuntimeError("Telemetry ERROR: %s holds %s records" % (path, logged))
+            self.capacity = max(capacity, self.count)
+        else:
+            self.count = 0
+            with open(path, 'wb') as f:
+                f.write(telemetry_header(0, self.capacity, self.dtype))
+        self.map()
+
+    def map(self):
+        size = TELEMETRY_HEADER_LENGTH + self.capacity * self.dtype.itemsize
+        with open(self.path, 'r+b') as f:
+            if os.path.getsize(self.path) < size:
+                f.truncate(size)
+        self.header = np.memmap(self.path, dtype='<u8', mode='r+', offset=16, shape=(2,))
+        self.header[1] = self.capacity
+        self.records = np.memmap(self.path, dtype=self.dtype, mode='r+',
+                                 offset=TELEMETRY_HEADER_LENGTH, shape=(self.capacity,))
+
+    def grow(self, count=1):
+        # called with the lock held, makes room for `count` more rows
+        self.records.flush()
+        while self.count + count > self.capacity:
+            self.capacity *= 2
+        self.map()
+
+    def record(self, t, dxl_id, position, load, goal, temperature):
+        with self.lock:
+            if self.count == self.capacity:
+                self.grow()
+            self.records[self.count] = (t, dxl_id, position, load, goal, temperature)
+            self.count += 1
+            self.header[0] = self.count
+
+    def append(self, rows):
+        """Append a structured array of rows of the log's dtype in one copy"""
+        with self.lock:
+            if self.count + len(rows) > self.capacity:
+                self.grow(len(rows))
+            self.records[self.count:self.count + len(rows)] = rows
+            self.count += len(rows)
+            self.header[0] = self.count
+
+    def record_states(self, states, servos):
+        """Record one row per Ax12State, stamped with the wall clock time, with the goal position
+        known to each servo's shadow"""
+        t = time.time()
+        for state, servo in zip(states, servos):
+            low, high = servo.shadow[ADDR_AX_GOAL_POSITION_L], servo.shadow[ADDR_AX_GOAL_POSITION_H]
+            goal = NO_GOAL if low is None or high is None else low | (high << 8)
+            self.record(t, state.id, state.position, state.load, goal, state.temperature)
+
+    def flush(self):
+        with self.lock:
+            self.records.flush()
+            self.header.flush()
+
+    def close(self):
+        self.flush()
+        self.records = None
+        self.header = None
+
+
+def telemetry_header(count, capacity, dtype=TELEMETRY_RECORD):
+    descr = json.dumps(np.dtype(dtype).descr).encode()
+    header = TELEMETRY_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_HEADER_LENGTH, count, capacity) + descr
+    if len(header) > TELEMETRY_HEADER_LENGTH:
+        raise RuntimeError("Telemetry ERROR: record description does not fit the header")
+    return header.ljust(TELEMETRY_HEADER_LENGTH, b'\0')
+
+
+def read_telemetry_header(path):
+    """Returns (count, capacity, record dtype) from the header of a telemetry log"""
+    with open(path, 'rb') as f:
+        header = f.read(TELEMETRY_HEADER_LENGTH)
+    magic, length, count, capacity = TELEMETRY_HEADER.unpack_from(header)
+    if magic != TELEMETRY_MAGIC:
+        raise RuntimeError("Telemetry ERROR: %s is not a telemetry log" % path)
+    descr = json.loads(header[TELEMETRY_HEADER.size:length].rstrip(b'\0'))
+    return count, capacity, np.dtype([tuple(field) for field in descr])
+
+
+def read_telemetry_log(path):
+    """Returns the recorded rows of a telemetry log as a read-only structured array mapped from the
+    file, without copying; e.g. rows[rows['id'] == 1]['load']"""
+    count, _, dtype = read_telemetry_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=TELEMETRY_HEADER_LENGTH, shape=(count,))
@@ -2,6 +2,7 @@
 
 ##### Imports ####################################
 # Numpy
+import asyncio
 import numpy as np
 from numpy import radians
 
@@ -17,6 +18,7 @@ from rtde_receive import RTDEReceiveInterface as RTDEReceive
 import serial.tools.list_ports
 # from magpie.motor_code import Motors
 from magpie.gripper import Gripper
+from magpie.async_gripper import AsyncGripper
 
 # Poses is from rmlib and used for converting between 4 x 4 homogenous pose and 6 element vector representation (x,y,z,rx,ry,rz)
 from magpie import poses
@@ -78,6 +80,7 @@ class UR5_Interface:
         self.ctrl       = None # -- `RTDEControlInterface` object
         self.recv       = None # -- `RTDEReceiveInterface` object
         self.gripper    = None # -- Gripper Controller Interface
+        self.agripper   = None # -- asyncio facade of `gripper`
         self.Q_safe     = [ radians( elem ) for elem in [ 12.30, -110.36, 95.90, -75.48, -89.59, 12.33 ] ]
         self.torqLim    = 600
         self.freq       = freq
@@ -102,6 +105,7 @@ class UR5_Interface:
             # self.gripper.torquelimit( self.torqLim )
             self.gripper = Gripper( servoPort )
             self.gripper.set_torque( self.torqLim, finger='both')
+            self.agripper = AsyncGripper( self.gripper )
         else:
             raise RuntimeError( "Could NOT connect to gripper Dynamixel board!" )
 
@@ -110,6 +114,10 @@ class UR5_Interface:
         """ Shutdown robot and gripper connections """
         self.ctrl.servoStop()
         self.ctrl.stopScript()
+        if self.agripper is not None:
+            # ends the motion thread and the bus executor the facade started
+            self.agripper.close()
+            self.agripper = None
         self.gripper.disconnect()
         
 
@@ -217,6 +225,43 @@ class UR5_Interface:
         self.gripper.close_gripper()
 
 
+    def wait_gripper( self, timeout = None ):
+        """ Block until the gripper fingers stop moving or `timeout` [s] passes, Return True if they stopped """
+        return self.gripper.wait_until_settled( finger = 'both', timeout = timeout )
+
+
+    async def wait_arm_async( self, period_s = 0.01 ):
+        """ Return once the arm is steady, checking every `period_s` without blocking the event loop """
+        while self.p_moving():
+            await asyncio.sleep( period_s )
+
+
+    async def moveL_async( self, poseMatrix, linSpeed = 0.25, linAccel = 0.5 ):
+        """ `moveL` that can be awaited, e.g. together with a gripper coroutine """
+        self.moveL( poseMatrix, linSpeed, linAccel, asynch = True )
+        await self.wait_arm_async()
+
+
+    async def open_gripper_async( self ):
+        """ `open_gripper` that can be awaited """
+        await self.agripper.open_gripper()
+
+
+    async def set_gripper_async( self, width ):
+        """ `set_gripper` that can be awaited, `width` in [m] """
+        await self.agripper.set_goal_aperture( width * 1000.0, finger = 'both', debug = False, record_load = False )
+
+
+    async def close_gripper_async( self ):
+        """ `close_gripper` that can be awaited """
+        await self.agripper.close_gripper()
+
+
+    async def get_gripper_sep_async( self ):
+        """ Return the separation between the gripper fingers in [m] """
+        return await self.agripper.get_aperture( finger = 'both' ) / 1000.0
+
+
     def get_gripper_sep( self ):
         """ Return the separation between the gripper fingers in [m] """
         return self.gripper.get_aperture( finger = 'both' ) / 1000.0